@@ -0,0 +1,103 @@
+"""
+Times Backtester.run on a synthetic daily price panel for growing
+parameter grids, and checks a few combinations against a straightforward
+per-day loop over the same class indexes.
+
+    python -m benchmarks.bench_backtest [--years 10] [--tickers 200]
+"""
+import argparse
+import logging
+import time
+import numpy as np
+import pandas as pd
+from config.settings import Settings
+from src.backtest import Backtester
+from benchmarks.synthetic import make_portfolio
+
+def make_history(portfolio_data, years, seed=3):
+    """Geometric random walks for every ticker, BRL=X and a ~10% a.a. daily CDI."""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=int(years * 252))
+    tickers = [item['ticker'] for item in portfolio_data if item['category'] != "RENDA_FIXA"] + ["BRL=X"]
+    steps = rng.normal(0.0003, 0.015, size=(len(dates), len(tickers)))
+    prices = pd.DataFrame(100 * np.exp(np.cumsum(steps, axis=0)), index=dates, columns=tickers)
+    # Listings and gaps: each ticker starts somewhere in the first third of the period
+    for j, ticker in enumerate(tickers[:-1]):
+        prices.iloc[:rng.integers(0, len(dates) // 3), j] = np.nan
+    cdi = pd.Series(rng.uniform(0.035, 0.045, len(dates)), index=dates)
+    categories = {item['ticker']: item['category'] for item in portfolio_data}
+    return prices, categories, cdi
+
+def reference_run(backtester, threshold, contribution, target, initial_value):
+    """Day by day, one combination at a time: the loop the engine replaces."""
+    index = backtester.index
+    classes = backtester.classes
+    rf = classes.index(Backtester.RF_CLASS)
+    events = set(backtester.event_days().tolist())
+    holdings = initial_value * target
+    twr, peak, max_drawdown = 1.0, 1.0, 0.0
+    for day in range(1, len(index)):
+        before = holdings.sum()
+        holdings = holdings * index[day] / index[day - 1]
+        twr *= holdings.sum() / before if before > 0 else 1.0
+        peak = max(peak, twr)
+        max_drawdown = max(max_drawdown, 1 - twr / peak)
+        if day not in events:
+            continue
+        total = holdings.sum()
+        pct = holdings / total * 100
+        diff = pct - target * 100
+        if (np.abs(diff) > threshold).any():
+            holdings = target * (total + contribution)
+            continue
+        gap = np.where(diff < 0, -diff, 0.0)
+        if pct[rf] > Settings.RF_PRIORITY_THRESHOLD:
+            gap[rf] = 0.0
+        share = gap / gap.sum() if gap.sum() > 0 else target
+        holdings = holdings + share * contribution
+    return holdings.sum(), (twr - 1) * 100, max_drawdown * 100
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=float, default=10)
+    parser.add_argument("--tickers", type=int, default=200)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 100, 1000, 5000, 20000],
+                        help="number of parameter combinations")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    portfolio_data, _ = make_portfolio(args.tickers)
+    start = time.perf_counter()
+    backtester = Backtester(*make_history(portfolio_data, args.years))
+    print(f"{len(backtester.dates)} days x {args.tickers} tickers -> class indexes in "
+          f"{(time.perf_counter() - start) * 1000:.1f} ms, {len(backtester.event_days())} monthly events")
+
+    rng = np.random.default_rng(11)
+    base = np.array([Settings.TARGET_ALLOCATION.get(c, 0.0) for c in backtester.classes])
+    print(f"{'combinations':>12} {'time':>10} {'per combo':>10}")
+    for size in args.sizes:
+        n_targets = max(1, size // 50)
+        targets = {"default": dict(Settings.TARGET_ALLOCATION)}
+        for t in range(1, n_targets):
+            mix = base * rng.uniform(0.5, 1.5, len(base))
+            targets[f"mix-{t}"] = dict(zip(backtester.classes, mix / mix.sum()))
+        thresholds = np.linspace(1, 20, 10)
+        contributions = np.linspace(0, 2000, max(1, size // (10 * n_targets)))
+        combinations = Backtester.grid(thresholds, contributions, list(targets))
+
+        start = time.perf_counter()
+        results = backtester.run(combinations, targets)
+        elapsed = time.perf_counter() - start
+        print(f"{len(results):>12} {elapsed * 1000:>7.1f} ms {elapsed / len(results) * 1e6:>7.1f} µs")
+
+    # Spot check against the per-day loop
+    worst = 0.0
+    for row in results.sample(min(5, len(results)), random_state=1).itertuples():
+        target = np.array([targets[row.target].get(c, 0.0) for c in backtester.classes])
+        final_value, total_return, max_drawdown = reference_run(backtester, row.threshold, row.contribution, target, 10000.0)
+        worst = max(worst, abs(final_value - row.final_value) / final_value,
+                    abs(total_return - row.total_return_pct) / 100, abs(max_drawdown - row.max_drawdown_pct) / 100)
+    print(f"max relative difference vs per-day loop: {worst:.2e}")
+
+if __name__ == "__main__":
+    main()
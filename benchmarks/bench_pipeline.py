@@ -0,0 +1,199 @@
+"""
+Offline end-to-end benchmark of main.job.
+
+Every external service is replaced by the local stand-ins in
+benchmarks/fakes.py (Yahoo, BCB, Google News, Gemini, the sheet CSV over a
+local HTTP server and a local SMTP sink), so runs are deterministic and need
+no credentials. For each portfolio size it reports per-stage wall and CPU
+time plus total wall time, CPU time and peak Python memory (tracemalloc).
+
+    python -m benchmarks.bench_pipeline                      # sizes 10, 100, 1000
+    python -m benchmarks.bench_pipeline 50 500 --warm        # also time a second, cache-warm run
+    python -m benchmarks.bench_pipeline --save-baseline      # store results in benchmarks/baseline.json
+    python -m benchmarks.bench_pipeline --check              # exit 1 if a stage regressed past the baseline
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import main
+from config.settings import Settings
+from src import ai_analyst, data_collector, indicators, news_collector, notifier
+from src.indicators import IndicatorsProvider
+from src.outbound import outbound
+from benchmarks import fakes
+from benchmarks.synthetic import make_portfolio
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+def install_fakes(workdir, counter, latency, sheet_url, sink):
+    """Points every collector and setting at the local stand-ins and a scratch directory."""
+    data_collector.yf = fakes.FakeYFinance(counter, latency)
+    indicators.sgs = fakes.FakeSGS(counter, latency)
+    indicators.currency = fakes.FakeCurrency(counter, latency)
+    news_collector.GoogleNews = fakes.make_fake_googlenews(counter, latency)
+    ai_analyst.genai = fakes.FakeGenAI(counter, latency)
+
+    Settings.SHEET_CSV_URL = sheet_url
+    Settings.GEMINI_API_KEY = "offline"
+    Settings.EMAIL_SENDER = "bench@local"
+    Settings.EMAIL_PASSWORD = "offline"
+    Settings.EMAIL_RECEIVER = "reader@local"
+    Settings.SMTP_HOST, Settings.SMTP_PORT, Settings.SMTP_STARTTLS = sink.host, sink.port, False
+
+    Settings.PRICE_STORE_PATH = os.path.join(workdir, "cache", "prices.sqlite")
+    Settings.FUNDAMENTALS_CACHE_PATH = os.path.join(workdir, "cache", "fundamentals.json")
+    Settings.INDICATORS_CACHE_PATH = os.path.join(workdir, "cache", "indicators.json")
+    Settings.AI_CACHE_PATH = os.path.join(workdir, "cache", "ai_responses.json")
+    Settings.CHART_CACHE_DIR = os.path.join(workdir, "cache", "charts")
+    Settings.TEMPLATE_CACHE_DIR = os.path.join(workdir, "cache", "templates")
+    Settings.SHEET_SNAPSHOT_DIR = os.path.join(workdir, "cache", "sheets")
+    notifier.get_template.cache_clear()
+    Settings.HISTORY_PATH = os.path.join(workdir, "history.jsonl")
+    Settings.METRICS_DIR = os.path.join(workdir, "metrics")
+    IndicatorsProvider.reset()
+    # The fakes have no rate limit of their own; measure the pipeline, not the throttle
+    Settings.OUTBOUND_RATE_LIMITS = {}
+    outbound.reset()
+
+def timed_stages(original, timings):
+    """Wraps run_stages so every stage records its wall and thread CPU time."""
+    def run_stages(stages, *args, **kwargs):
+        for stage in stages:
+            def timed(results, fn=stage.fn, name=stage.name):
+                wall, cpu = time.perf_counter(), time.thread_time()
+                try:
+                    return fn(results)
+                finally:
+                    timings[name] = {
+                        "wall_ms": (time.perf_counter() - wall) * 1000,
+                        "cpu_ms": (time.thread_time() - cpu) * 1000
+                    }
+            stage.fn = timed
+        return original(stages, *args, **kwargs)
+
+    return run_stages
+
+def run_once(label, original_run_stages, counter):
+    timings = {}
+    calls_before = dict(counter.calls)
+    main.run_stages = timed_stages(original_run_stages, timings)
+    tracemalloc.start()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        main.job()
+        ok = True
+    except SystemExit:
+        ok = False
+    total = {
+        "wall_ms": (time.perf_counter() - wall) * 1000,
+        "cpu_ms": (time.process_time() - cpu) * 1000,
+        "peak_mb": tracemalloc.get_traced_memory()[1] / 1e6
+    }
+    tracemalloc.stop()
+    IndicatorsProvider.reset()
+    calls = {name: count - calls_before.get(name, 0) for name, count in counter.calls.items()}
+    return {"label": label, "ok": ok, "stages": timings, "total": total, "calls": calls}
+
+def bench_size(n_positions, latency, warm):
+    counter = fakes.CallCounter()
+    portfolio_data, _ = make_portfolio(n_positions)
+    workdir = tempfile.mkdtemp(prefix="invest-ai-bench-")
+    sheet = fakes.SheetServer(fakes.portfolio_csv(portfolio_data), counter, latency)
+    sink = fakes.SMTPSink(counter)
+    original_run_stages = main.run_stages
+    try:
+        install_fakes(workdir, counter, latency, sheet.url, sink)
+        runs = [run_once("cold", original_run_stages, counter)]
+        if warm:
+            runs.append(run_once("warm", original_run_stages, counter))
+        return runs
+    finally:
+        main.run_stages = original_run_stages
+        sheet.close()
+        sink.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def print_report(results):
+    for size, runs in results.items():
+        for run in runs:
+            total = run["total"]
+            status = "" if run["ok"] else "  ** FAILED **"
+            print(f"\n{size} positions ({run['label']}): total {total['wall_ms']:.0f} ms wall, "
+                  f"{total['cpu_ms']:.0f} ms CPU, peak {total['peak_mb']:.1f} MB{status}")
+            for name, stage in run["stages"].items():
+                print(f"  {name:<12} {stage['wall_ms']:>9.1f} ms wall {stage['cpu_ms']:>9.1f} ms CPU")
+            print(f"  calls: {run['calls']}")
+
+def check_baseline(results, baseline, tolerance, slack_ms):
+    """Returns a list of human-readable regressions against the stored baseline."""
+    regressions = []
+    for size, runs in results.items():
+        for run in runs:
+            reference = baseline.get(str(size), {}).get(run["label"])
+            if not reference:
+                continue
+            measured = dict(run["stages"], total=run["total"])
+            expected = dict(reference["stages"], total=reference["total"])
+            for name, values in measured.items():
+                if name not in expected:
+                    continue
+                limit = expected[name]["wall_ms"] * (1 + tolerance) + slack_ms
+                if values["wall_ms"] > limit:
+                    regressions.append(
+                        f"{size}/{run['label']}/{name}: {values['wall_ms']:.1f} ms > {limit:.1f} ms "
+                        f"(baseline {expected[name]['wall_ms']:.1f} ms)"
+                    )
+    return regressions
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sizes", nargs="*", type=int, default=[10, 100, 1000])
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="simulated round-trip per external request")
+    parser.add_argument("--warm", action="store_true", help="also run a second time against the warm caches")
+    parser.add_argument("--json", help="write the raw results to this file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="fail when a stage regresses past the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown (default 25%%)")
+    parser.add_argument("--slack-ms", type=float, default=25.0, help="absolute slack added to every limit")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    results = {size: bench_size(size, args.latency_ms / 1000, args.warm) for size in args.sizes}
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({str(size): {run["label"]: run for run in runs} for size, runs in results.items()}, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+
+    failed = [f"{size}/{run['label']}" for size, runs in results.items() for run in runs if not run["ok"]]
+    if failed:
+        print(f"\nJob failed for: {failed}")
+        return 1
+
+    if args.check:
+        if not os.path.exists(args.baseline):
+            print(f"\nNo baseline at {args.baseline}; run with --save-baseline first.")
+            return 1
+        with open(args.baseline, "r") as f:
+            regressions = check_baseline(results, json.load(f), args.tolerance, args.slack_ms)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            return 1
+        print("\nNo regressions against baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,90 @@
+"""
+Compares PortfolioManager.value_positions (columnar) with the previous
+per-item valuation loop and checks that both produce the same frame.
+
+    python -m benchmarks.bench_valuation [N ...]
+"""
+import sys
+import time
+import logging
+import pandas as pd
+from src.portfolio import PortfolioManager
+from benchmarks.synthetic import make_portfolio
+
+def legacy_value_positions(portfolio_data, market_data):
+    """The per-item loop calculate_portfolio used before the columnar engine."""
+    portfolio = []
+    total_value = 0
+    for item in portfolio_data:
+        ticker = item['ticker']
+        qty = item['quantity']
+        category = item.get('category', 'OUTROS')
+        data = market_data.get(ticker, {})
+        current_price = data.get('price', 0)
+
+        if category == "RENDA_FIXA":
+            value_brl = qty * 1.0
+            current_price = 1.0
+        elif category == "CRYPTO":
+            if ticker.endswith("-BRL"):
+                value_brl = current_price * qty
+            else:
+                usd_rate = market_data.get('BRL=X', {}).get('price', 0)
+                if usd_rate <= 0:
+                    usd_rate = 6.00
+                value_brl = current_price * qty * usd_rate
+        elif category in ["US_REITS", "US_STOCKS"]:
+            usd_rate = market_data.get('BRL=X', {}).get('price', 0)
+            if usd_rate <= 0:
+                usd_rate = 6.00
+            value_brl = current_price * qty * usd_rate
+        else:
+            value_brl = current_price * qty
+
+        if pd.isna(value_brl):
+            value_brl = 0.0
+        total_value += value_brl
+
+        portfolio.append({
+            "ticker": ticker, "qty": qty, "price": current_price, "value_brl": value_brl,
+            "category": category, "name": data.get('name', ticker),
+            "dy_12m": data.get('dy_12m', 0), "p_vp": data.get('p_vp', 0),
+            "pe": data.get('pe', 0), "roe": data.get('roe', 0),
+            "sector": data.get('sector', 'Unknown'), "recommendation": data.get('recommendation', 'None'),
+            "change_1d": data.get('change_1d', 0), "change_12m": data.get('change_12m', 0),
+            "profit_loss_pct": 0.0, "profit_loss_val": 0.0
+        })
+
+    df = pd.DataFrame(portfolio)
+    df['allocation'] = (df['value_brl'] / total_value) * 100
+    return df, total_value
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main(sizes):
+    logging.disable(logging.WARNING)  # zero-price warnings would dominate the timing
+    print(f"{'positions':>10} {'loop (ms)':>12} {'columnar (ms)':>14} {'speedup':>8}")
+    for n in sizes:
+        portfolio_data, market_data = make_portfolio(n)
+        repeat = 3 if n >= 100_000 else 5
+
+        loop_t, (loop_df, loop_total) = best_of(lambda: legacy_value_positions(portfolio_data, market_data), repeat)
+        manager = PortfolioManager(portfolio_data, market_data, {})
+        vec_t, (vec_df, vec_total) = best_of(manager.value_positions, repeat)
+
+        pd.testing.assert_frame_equal(
+            loop_df.reset_index(drop=True), vec_df.reset_index(drop=True),
+            check_dtype=False, rtol=1e-9
+        )
+        assert abs(loop_total - vec_total) <= 1e-6 * max(1.0, abs(loop_total))
+
+        print(f"{n:>10} {loop_t * 1000:>12.1f} {vec_t * 1000:>14.1f} {loop_t / vec_t:>7.1f}x")
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000])
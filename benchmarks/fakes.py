@@ -0,0 +1,283 @@
+"""
+Local stand-ins for every external service the pipeline talks to, so the
+whole job can run offline with deterministic data:
+
+- FakeYFinance: `yf.download`, `yf.Ticker(...).history/info/fast_info`
+- FakeSGS / FakeCurrency: `bcb.sgs.get`, `bcb.currency.get`
+- FakeGoogleNews: the `GoogleNews` class
+- FakeGenAI: `genai.Client(...).models.generate_content`
+- SheetServer: serves the portfolio CSV over HTTP (supports ETag/Last-Modified)
+- SMTPSink: minimal SMTP server that accepts and stores every message
+
+Every fake sleeps `latency` seconds per request to model a network round-trip.
+"""
+import csv
+import io
+import time
+import hashlib
+import threading
+import socketserver
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+
+class CallCounter:
+    def __init__(self):
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def hit(self, name):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+def _price_seed(ticker):
+    return int(hashlib.md5(ticker.encode()).hexdigest()[:8], 16)
+
+def synthetic_closes(ticker, index):
+    """Deterministic random-walk closes for `ticker` on the given dates."""
+    rng = np.random.default_rng(_price_seed(ticker))
+    # Walk over a fixed calendar so overlapping requests return identical closes
+    days = (index - pd.Timestamp("2000-01-01")).days.to_numpy()
+    base = 20 + (_price_seed(ticker) % 200)
+    drift = rng.normal(0.0003, 0.0002)
+    vol = rng.uniform(0.01, 0.03)
+    return base * np.exp(drift * days + vol * np.sin(days / 7.0 + _price_seed(ticker) % 13))
+
+class FakeTicker:
+    def __init__(self, owner, ticker):
+        self.owner = owner
+        self.ticker = ticker
+
+    def history(self, period=None, start=None, end=None, **kwargs):
+        self.owner.counter.hit("yf.history")
+        time.sleep(self.owner.latency)
+        index = self.owner._dates(period, start, end)
+        return pd.DataFrame({"Close": synthetic_closes(self.ticker, index)}, index=index)
+
+    @property
+    def info(self):
+        self.owner.counter.hit("yf.info")
+        time.sleep(self.owner.latency)
+        seed = _price_seed(self.ticker)
+        return {
+            "dividendYield": (seed % 900) / 10000, "priceToBook": 0.5 + (seed % 30) / 10,
+            "trailingPE": 3 + seed % 27, "returnOnEquity": (seed % 35) / 100,
+            "sector": "Financial Services", "recommendationKey": "hold", "shortName": self.ticker
+        }
+
+    @property
+    def fast_info(self):
+        self.owner.counter.hit("yf.fast_info")
+        return {"last_price": float(synthetic_closes(self.ticker, pd.DatetimeIndex([pd.Timestamp.now().normalize()]))[0])}
+
+class FakeYFinance:
+    """Drop-in for the `yfinance` module as used by DataCollector."""
+
+    def __init__(self, counter, latency=0.0):
+        self.counter = counter
+        self.latency = latency
+
+    @staticmethod
+    def _dates(period=None, start=None, end=None):
+        today = pd.Timestamp.now().normalize()
+        start = pd.Timestamp(start) if start else today - pd.Timedelta(days=365)
+        end = pd.Timestamp(end) - pd.Timedelta(days=1) if end else today
+        return pd.bdate_range(start, end)
+
+    def Ticker(self, ticker):
+        return FakeTicker(self, ticker)
+
+    def download(self, tickers, period=None, start=None, end=None, **kwargs):
+        self.counter.hit("yf.download")
+        time.sleep(self.latency)
+        tickers = [tickers] if isinstance(tickers, str) else list(tickers)
+        index = self._dates(period, start, end)
+        closes = {ticker: synthetic_closes(ticker, index) for ticker in tickers}
+        frame = pd.DataFrame(closes, index=index)
+        frame.columns = pd.MultiIndex.from_product([["Close"], tickers])
+        return frame
+
+class FakeSGS:
+    def __init__(self, counter, latency=0.0):
+        self.counter = counter
+        self.latency = latency
+
+    def get(self, codes, last=0, **kwargs):
+        self.counter.hit("bcb.sgs")
+        time.sleep(self.latency)
+        values = {432: 15.0, 4389: 14.9, 12: 0.055}
+        return pd.DataFrame({name: [values.get(code, 1.0)] for name, code in codes.items()},
+                            index=[pd.Timestamp.now().normalize()])
+
+class FakeCurrency:
+    def __init__(self, counter, latency=0.0):
+        self.counter = counter
+        self.latency = latency
+
+    def get(self, symbols, start=None, end=None, **kwargs):
+        self.counter.hit("bcb.currency")
+        time.sleep(self.latency)
+        return pd.DataFrame({"USD": [5.41, 5.43]}, index=pd.bdate_range(end=pd.Timestamp.now(), periods=2))
+
+def make_fake_googlenews(counter, latency=0.0):
+    class FakeGoogleNews:
+        def __init__(self, lang=None, region=None, **kwargs):
+            self._results = []
+
+        def clear(self):
+            self._results = []
+
+        def search(self, query):
+            counter.hit("googlenews")
+            time.sleep(latency)
+            self._results = [
+                {"title": f"{query}: manchete {i}", "date": "há 1 hora", "link": f"https://news.local/{i}"}
+                for i in range(10)
+            ]
+
+        def result(self):
+            return self._results
+
+    return FakeGoogleNews
+
+class FakeGenAI:
+    """Drop-in for `google.genai`: Client(...).models.generate_content(...)."""
+
+    def __init__(self, counter, latency=0.0):
+        self.counter = counter
+        self.latency = latency
+
+    def Client(self, api_key=None, **kwargs):
+        owner = self
+
+        class Response:
+            def __init__(self, text):
+                self.text = text
+
+        class Models:
+            def generate_content(self, model=None, contents=None, **kwargs):
+                owner.counter.hit("genai")
+                time.sleep(owner.latency)
+                return Response(f"**Análise ({model})**\n\nPrompt com {len(contents or '')} caracteres.")
+
+        class Client:
+            models = Models()
+
+        return Client()
+
+def portfolio_csv(portfolio_data):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["Ticker", "Quantidade", "Categoria", "Meta"])
+    for item in portfolio_data:
+        quantity = f"{item['quantity']:.2f}".replace(".", ",")
+        writer.writerow([item["ticker"], quantity, item["category"], "5%"])
+    return buffer.getvalue().encode("utf-8")
+
+class SheetServer:
+    """Serves one CSV document at http://127.0.0.1:<port>/sheet.csv with ETag/Last-Modified."""
+
+    def __init__(self, body, counter, latency=0.0):
+        self.body = body
+        self.etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        self.last_modified = formatdate(usegmt=True)
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                counter.hit("sheet")
+                time.sleep(latency)
+                if self.headers.get("If-None-Match") == owner.etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/csv; charset=utf-8")
+                self.send_header("Content-Length", str(len(owner.body)))
+                self.send_header("ETag", owner.etag)
+                self.send_header("Last-Modified", owner.last_modified)
+                self.end_headers()
+                self.wfile.write(owner.body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/sheet.csv"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class SMTPSink:
+    """
+    Just enough SMTP (EHLO, AUTH PLAIN, MAIL, RCPT, DATA, RSET, NOOP,
+    QUIT) for smtplib to deliver messages. No STARTTLS: run the notifier
+    with Settings.SMTP_STARTTLS = False.
+    """
+
+    def __init__(self, counter):
+        self.messages = []
+        self.connections = 0
+        owner = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write((line + "\r\n").encode())
+
+            def handle(self):
+                owner.connections += 1
+                counter.hit("smtp.connect")
+                self.reply("220 sink.local ESMTP")
+                envelope = {"rcpt": []}
+                while True:
+                    raw = self.rfile.readline()
+                    if not raw:
+                        return
+                    command = raw.decode(errors="replace").strip()
+                    verb = command.split(" ", 1)[0].upper()
+                    if verb in ("EHLO", "HELO"):
+                        self.wfile.write(b"250-sink.local\r\n250-AUTH PLAIN\r\n250 8BITMIME\r\n")
+                    elif verb == "AUTH":
+                        # smtplib sends "AUTH PLAIN <credentials>" in one line; any credentials pass
+                        self.reply("235 2.7.0 Authentication successful")
+                    elif verb == "MAIL":
+                        envelope = {"from": command[10:], "rcpt": []}
+                        self.reply("250 OK")
+                    elif verb == "RCPT":
+                        envelope["rcpt"].append(command[8:])
+                        self.reply("250 OK")
+                    elif verb == "DATA":
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                        lines = []
+                        while True:
+                            line = self.rfile.readline()
+                            if line in (b".\r\n", b""):
+                                break
+                            lines.append(line)
+                        envelope["data"] = b"".join(lines)
+                        owner.messages.append(envelope)
+                        counter.hit("smtp.message")
+                        self.reply("250 OK queued")
+                        envelope = {"rcpt": []}
+                    elif verb in ("RSET", "NOOP"):
+                        self.reply("250 OK")
+                    elif verb == "QUIT":
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        self.reply("502 Command not implemented")
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self.server = Server(("127.0.0.1", 0), Handler)
+        self.host, self.port = self.server.server_address
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,39 @@
+"""Synthetic portfolios and market data shared by the benchmark scripts."""
+import random
+
+CATEGORIES = ["BR_STOCKS", "FIIS", "ETFS", "US_STOCKS", "US_REITS", "CRYPTO", "RENDA_FIXA"]
+
+def make_portfolio(n_positions, seed=42):
+    """Returns (portfolio_data, market_data) shaped like SheetsManager/DataCollector output."""
+    rng = random.Random(seed)
+    portfolio_data = []
+    market_data = {"BRL=X": {"price": 5.40, "name": "USD/BRL"}}
+
+    for i in range(n_positions):
+        category = CATEGORIES[i % len(CATEGORIES)]
+        if category == "RENDA_FIXA":
+            ticker = f"RDB-{i}"
+        elif category == "CRYPTO":
+            ticker = f"C{i}-BRL" if i % 2 else f"C{i}-USD"
+        elif category in ("US_STOCKS", "US_REITS"):
+            ticker = f"US{i}"
+        else:
+            ticker = f"BR{i}.SA"
+
+        portfolio_data.append({
+            "ticker": ticker,
+            "quantity": float(rng.randint(1, 500)),
+            "category": category,
+            "target_pct": 0.0
+        })
+        market_data[ticker] = {
+            # A few missing quotes exercise the zero-price path
+            "price": 0.0 if i % 97 == 0 else rng.uniform(1, 300),
+            "change_1d": rng.gauss(0, 1.5),
+            "change_12m": rng.gauss(8, 20),
+            "dy_12m": rng.uniform(0, 12), "p_vp": rng.uniform(0.5, 3),
+            "pe": rng.uniform(3, 30), "roe": rng.uniform(-5, 30),
+            "sector": "Unknown", "recommendation": "hold", "name": ticker
+        }
+
+    return portfolio_data, market_data
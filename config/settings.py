@@ -21,16 +21,138 @@ class Settings:
     EMAIL_SENDER = os.getenv("EMAIL_SENDER")
     EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
     EMAIL_RECEIVER = os.getenv("EMAIL_RECEIVER")
+    SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+    SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+    SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+    # Conexão SMTP reaproveitada entre e-mails: reabre após N mensagens, retry com backoff em erros transitórios
+    SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", "30"))
+    SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "90"))
+    SMTP_IDLE_CHECK_SECONDS = float(os.getenv("SMTP_IDLE_CHECK_SECONDS", "30"))
+    SMTP_RETRIES = int(os.getenv("SMTP_RETRIES", "3"))
+    SMTP_RETRY_BACKOFF_SECONDS = float(os.getenv("SMTP_RETRY_BACKOFF_SECONDS", "2"))
+    # Bytecode compilado do template do e-mail (Jinja), reaproveitado entre execuções
+    TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR", "data/cache/templates")
 
     # IA (Gemini)
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+    # Cache das respostas do Gemini (mesmo prompt + modelo = mesma resposta, sem nova chamada)
+    AI_CACHE_ENABLED = os.getenv("AI_CACHE_ENABLED", "true").lower() == "true"
+    AI_CACHE_PATH = os.getenv("AI_CACHE_PATH", "data/cache/ai_responses.json")
+    AI_CACHE_TTL_HOURS = float(os.getenv("AI_CACHE_TTL_HOURS", "12"))
+    AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "50"))
+    # Reaproveita a resposta se todos os números do prompt variaram menos que isso (%); 0 = só prompt idêntico
+    AI_CACHE_TOLERANCE_PCT = float(os.getenv("AI_CACHE_TOLERANCE_PCT", "0"))
+    # Prompt da IA: orçamento de tokens e quantos destaques (maiores variações, L/P, posições) listar
+    AI_PROMPT_TOKEN_BUDGET = int(os.getenv("AI_PROMPT_TOKEN_BUDGET", "2000"))
+    AI_PROMPT_TOP_K = int(os.getenv("AI_PROMPT_TOP_K", "5"))
+    # Requisições "hedged": se o modelo principal não responder em X s, dispara o próximo em paralelo
+    AI_HEDGE_ENABLED = os.getenv("AI_HEDGE_ENABLED", "true").lower() == "true"
+    AI_HEDGE_DELAY_SECONDS = float(os.getenv("AI_HEDGE_DELAY_SECONDS", "10"))
+    AI_DEADLINE_SECONDS = float(os.getenv("AI_DEADLINE_SECONDS", "90"))
+    AI_MODEL_STATS_PATH = os.getenv("AI_MODEL_STATS_PATH", "data/cache/ai_model_stats.json")
 
     # App
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    # Etapas independentes do job (planilha, BCB, notícias, IA, gráfico) rodam em paralelo
+    PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))
+    # Métricas por execução (duração das etapas, latência por ticker, retries, cache) em JSON
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    METRICS_DIR = os.getenv("METRICS_DIR", "logs/metrics")
+    # Gráfico de alocação: "png" (paleta otimizada) ou "svg"; cacheado pela alocação arredondada
+    CHART_FORMAT = os.getenv("CHART_FORMAT", "png")
+    CHART_DPI = int(os.getenv("CHART_DPI", "100"))
+    CHART_CACHE_ENABLED = os.getenv("CHART_CACHE_ENABLED", "true").lower() == "true"
+    CHART_CACHE_DIR = os.getenv("CHART_CACHE_DIR", "data/cache/charts")
+    CHART_CACHE_MAX_FILES = int(os.getenv("CHART_CACHE_MAX_FILES", "20"))
+
+    # Modo contínuo (--watch): atualiza só as cotações a cada N minutos e envia o relatório no horário diário
+    WATCH_REFRESH_MINUTES = int(os.getenv("WATCH_REFRESH_MINUTES", "15"))
+    WATCH_REPORT_TIME = os.getenv("WATCH_REPORT_TIME", "08:00")
+
+    # Chamadas externas (Yahoo, BCB, Google News, planilha): limite por host (requisições/s, rajada),
+    # retry com backoff exponencial + jitter e circuit breaker (para de insistir num host fora do ar)
+    OUTBOUND_RATE_LIMITS = {
+        "yahoo": (float(os.getenv("OUTBOUND_YAHOO_RPS", "10")), 20),
+        "bcb": (float(os.getenv("OUTBOUND_BCB_RPS", "2")), 4),
+        "googlenews": (float(os.getenv("OUTBOUND_GOOGLENEWS_RPS", "0.5")), 1),
+        "sheets": (float(os.getenv("OUTBOUND_SHEETS_RPS", "1")), 2)
+    }
+    OUTBOUND_RETRIES = int(os.getenv("OUTBOUND_RETRIES", "3"))
+    OUTBOUND_BACKOFF_SECONDS = float(os.getenv("OUTBOUND_BACKOFF_SECONDS", "0.5"))
+    OUTBOUND_BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOUND_BACKOFF_MAX_SECONDS", "8"))
+    OUTBOUND_BREAKER_FAILURES = int(os.getenv("OUTBOUND_BREAKER_FAILURES", "5"))
+    OUTBOUND_BREAKER_RESET_SECONDS = float(os.getenv("OUTBOUND_BREAKER_RESET_SECONDS", "60"))
+    # Resposta vazia (ex.: Yahoo sob throttling devolve um DataFrame vazio): novas tentativas antes de desistir
+    OUTBOUND_EMPTY_RETRIES = int(os.getenv("OUTBOUND_EMPTY_RETRIES", "2"))
+
+    # Market Data (Yahoo Finance)
+    # Baixa o histórico de preços de vários tickers por requisição em vez de um a um
+    YF_BATCH_DOWNLOAD = os.getenv("YF_BATCH_DOWNLOAD", "true").lower() == "true"
+    YF_BATCH_SIZE = int(os.getenv("YF_BATCH_SIZE", "50"))
+
+    # Métricas de risco a partir do histórico de 1 ano já baixado (o benchmark vai no mesmo download)
+    RISK_BENCHMARK = os.getenv("RISK_BENCHMARK", "^BVSP")
+    RISK_CONFIDENCE = float(os.getenv("RISK_CONFIDENCE", "0.95"))
+
+    # Cache local de cotações (SQLite): só baixa os dias que faltam em cada execução
+    PRICE_STORE_ENABLED = os.getenv("PRICE_STORE_ENABLED", "true").lower() == "true"
+    PRICE_STORE_PATH = os.getenv("PRICE_STORE_PATH", "data/cache/prices.sqlite")
+    PRICE_STORE_MAX_AGE_MINUTES = int(os.getenv("PRICE_STORE_MAX_AGE_MINUTES", "30"))
+    PRICE_STORE_OVERLAP_DAYS = int(os.getenv("PRICE_STORE_OVERLAP_DAYS", "5"))
+
+    # Fundamentos (stock.info) buscados em paralelo, com prazo por ticker e orçamento total (segundos)
+    FUNDAMENTALS_WORKERS = int(os.getenv("FUNDAMENTALS_WORKERS", "8"))
+    FUNDAMENTALS_TICKER_TIMEOUT = float(os.getenv("FUNDAMENTALS_TICKER_TIMEOUT", "15"))
+    FUNDAMENTALS_STAGE_BUDGET = float(os.getenv("FUNDAMENTALS_STAGE_BUDGET", "90"))
+
+    # Cache de fundamentos em disco: validade (dias) por grupo de campos e limite de tickers (LRU)
+    FUNDAMENTALS_CACHE_ENABLED = os.getenv("FUNDAMENTALS_CACHE_ENABLED", "true").lower() == "true"
+    FUNDAMENTALS_CACHE_PATH = os.getenv("FUNDAMENTALS_CACHE_PATH", "data/cache/fundamentals.json")
+    FUNDAMENTALS_CACHE_MAX_ENTRIES = int(os.getenv("FUNDAMENTALS_CACHE_MAX_ENTRIES", "2000"))
+    FUNDAMENTALS_TTL_DAYS = {
+        "valuation": float(os.getenv("FUNDAMENTALS_TTL_VALUATION_DAYS", "7")),   # DY, P/VP, P/L, ROE
+        "rating": float(os.getenv("FUNDAMENTALS_TTL_RATING_DAYS", "3")),         # Recomendação
+        "profile": float(os.getenv("FUNDAMENTALS_TTL_PROFILE_DAYS", "90"))       # Setor, nome
+    }
     
+    # Banco Central (SGS): séries buscadas em uma única chamada e cacheadas até o próximo dia útil
+    SGS_SERIES = {
+        "selic_meta": 432,  # Meta Selic (% a.a.)
+        "cdi": 4389         # CDI anualizado base 252 (% a.a.)
+    }
+    # Backtest: CDI diário (% a.d.) usado para a Renda Fixa
+    BACKTEST_CDI_SERIES = 12
+    INDICATORS_CACHE_PATH = os.getenv("INDICATORS_CACHE_PATH", "data/cache/indicators.json")
+
+    # Histórico diário da carteira (log JSON Lines, uma linha por dia)
+    HISTORY_PATH = os.getenv("HISTORY_PATH", "data/history.jsonl")
+    HISTORY_LEGACY_PATH = "data/history.json"
+    HISTORY_COMPACT_THRESHOLD = int(os.getenv("HISTORY_COMPACT_THRESHOLD", "30"))
+    # Dias que uma falha nova de cotação pode adiar o registro do dia (depois disso grava marcado como parcial)
+    HISTORY_MAX_SKIP_DAYS = int(os.getenv("HISTORY_MAX_SKIP_DAYS", "3"))
+
     # Google Sheets CSV Link
     SHEET_CSV_URL = "https://docs.google.com/spreadsheets/d/e/2PACX-1vQsiq3RTqfKGES0ntzkV_crn8BN43DleBxbpUr-UX32zD28ppyURXLaLnYIGaGmXt1Nvu3jUNsdjmiK/pub?gid=0&single=true&output=csv"
+    # Última cópia boa da planilha (download condicional com ETag; usada se o Google falhar)
+    SHEET_SNAPSHOT_DIR = os.getenv("SHEET_SNAPSHOT_DIR", "data/cache/sheets")
     
+    # Categorias aceitas na planilha (coluna Categoria) -> classe da alocação ideal
+    CATEGORY_MAP = {
+        "BR_STOCKS": "Ações BR",
+        "FIIS": "FIIs",
+        "ETFS": "ETFs",
+        "US_REITS": "REITs",
+        "US_STOCKS": "Ações EUA",
+        "CRYPTO": "Cripto",
+        "RENDA_FIXA": "Renda Fixa"
+    }
+
+    # Aporte: prioriza renda variável enquanto a Renda Fixa estiver acima deste percentual
+    RF_PRIORITY_THRESHOLD = float(os.getenv("RF_PRIORITY_THRESHOLD", "40"))
+    # Ordens de compra do aporte: ações/FIIs/ETFs em cotas inteiras; estas categorias em frações de R$ X
+    CONTRIBUTION_FRACTIONAL_CATEGORIES = ["RENDA_FIXA", "CRYPTO"]
+    CONTRIBUTION_FRACTIONAL_STEP = float(os.getenv("CONTRIBUTION_FRACTIONAL_STEP", "1.00"))
+
     # Alocação Ideal Atualizada
     TARGET_ALLOCATION = {
         "Renda Fixa": 0.35,  # 35%
@@ -1,15 +1,17 @@
 import logging
 import sys
 import os
+import re
+import json
 from datetime import datetime
 from config.settings import Settings
-from src.data_collector import DataCollector
-from src.portfolio import PortfolioManager
-from src.report_generator import ReportGenerator
-from src.notifier import Notifier
-from src.ai_analyst import AIAnalyst
-from src.news_collector import NewsCollector
-from src.sheets_manager import SheetsManager
+from src.pipeline import Stage, PipelineAbort, run_stages
+from src.metrics import metrics
+from src.outbound import outbound
+
+# The collectors, pandas, matplotlib, yfinance, google.genai, bcb and
+# GoogleNews are imported inside the stages that use them: a run that
+# aborts early (empty sheet, --validate) never pays for loading them.
 
 # Configure Logging
 os.makedirs("logs", exist_ok=True)
@@ -23,63 +25,367 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def job():
-    logger.info("Starting daily financial report job...")
-    try:
-        # 1. Load Portfolio from Sheets
-        portfolio_data = SheetsManager.get_portfolio_from_sheets()
-        if not portfolio_data:
-            logger.error("Failed to load portfolio data. Aborting.")
-            return
-
-        # 2. Data Collection
-        collector = DataCollector(portfolio_data)
-        market_data = collector.get_market_data()
-        indicators = collector.get_economic_indicators()
-        
-        # 2.1 News Collection
-        news_collector = NewsCollector()
-        news_summary = news_collector.get_top_news()
-        
+def report_stages(recipients=None, target_allocation=None, history_path=None,
+                  contribution_amount=250.00, analyst=None, notifier=None):
+    """
+    Stages that turn 'sheet', 'market', 'indicators' and 'news' results into
+    a sent report. Risk metrics and AI analysis run concurrently with chart
+    rendering.
+    """
+    def portfolio(r):
         # 3. Portfolio Logic
-        manager = PortfolioManager(portfolio_data, market_data, indicators)
+        from src.portfolio import PortfolioManager
+        manager = PortfolioManager(r['sheet'], r['market'], r['indicators'], target_allocation, history_path)
         portfolio_df, total_value, daily_variation_pct = manager.calculate_portfolio()
         suggestions_df = manager.get_rebalancing_suggestions(portfolio_df, total_value)
-        contribution_df = manager.suggest_contribution(250.00, suggestions_df)
-        
+        orders_df, leftover = manager.suggest_orders(contribution_amount, portfolio_df, total_value)
+        contribution_df = manager.suggest_contribution(contribution_amount, suggestions_df, orders_df)
+        return {
+            'portfolio_df': portfolio_df,
+            'total_value': total_value,
+            'daily_variation_pct': daily_variation_pct,
+            'missing_quotes': manager.missing,
+            'suggestions': suggestions_df,
+            'contribution': contribution_df,
+            'orders': orders_df,
+            'leftover': leftover
+        }
+
+    def risk(r):
+        # Risk metrics from the 1y price panel the market data was built from (no extra download)
+        history = getattr(r['market'], 'history', None)
+        if history is None:
+            return None
+        from src.risk import RiskAnalyzer
+        p = r['portfolio']
+        try:
+            return RiskAnalyzer().analyze(history, p['portfolio_df'], p['total_value'])
+        except Exception as e:
+            logger.warning(f"Risk metrics unavailable: {e}")
+            return None
+
+    def ai(r):
         # 3. AI Analysis
         logger.info("Generating AI Analysis...")
-        analyst = AIAnalyst()
-        ai_analysis = analyst.generate_ai_analysis(portfolio_df, total_value, indicators, news_summary)
-        
+        if analyst is None and not Settings.GEMINI_API_KEY:
+            # Same answer AIAnalyst would give, without importing google.genai
+            logger.warning("GEMINI_API_KEY não configurada. A análise de IA será pulada.")
+            return "Análise de IA indisponível (Chave API não configurada)."
+
+        from src.ai_analyst import AIAnalyst
+        p = r['portfolio']
+        return (analyst or AIAnalyst()).generate_ai_analysis(
+            p['portfolio_df'], p['total_value'], r['indicators'], r['news'], r['risk'], target_allocation
+        )
+
+    def chart(r):
         # 4. Report Generation (Chart only)
+        from src.report_generator import ReportGenerator
         generator = ReportGenerator()
-        chart_b64 = generator.generate_allocation_chart(portfolio_df)
-        
+        return generator.generate_allocation_chart(r['portfolio']['portfolio_df']), generator.chart_mime_type
+
+    def email(r):
         # 5. Notification
-        notifier = Notifier()
+        p = r['portfolio']
+        allocation_chart, chart_mime = r['chart']
         subject = f"Relatório Financeiro Diário - {datetime.now().strftime('%d/%m/%Y')}"
         
         # Prepare context for Email Template
         email_context = {
             'date': datetime.now().strftime('%d/%m/%Y'),
-            'total_value': total_value,
-            'daily_variation_pct': daily_variation_pct,
-            'indicators': indicators,
-            'ai_analysis': ai_analysis,
-            'suggestions': suggestions_df,
-            'contribution': contribution_df,
-            'allocation_chart': chart_b64
+            'total_value': p['total_value'],
+            'daily_variation_pct': p['daily_variation_pct'],
+            'missing_quotes': p['missing_quotes'],
+            'indicators': r['indicators'],
+            'ai_analysis': r['ai'],
+            'suggestions': p['suggestions'],
+            'contribution': p['contribution'],
+            'contribution_amount': contribution_amount,
+            'orders': p['orders'],
+            'risk': r['risk'],
+            'leftover': p['leftover'],
+            'allocation_chart': allocation_chart,
+            'allocation_chart_mime': chart_mime
         }
         
         # Send Email
-        notifier.send_email(subject, email_context)
+        if notifier:
+            notifier.send_email(subject, email_context, recipients)
+            return
+
+        from src.notifier import Notifier
+        own_notifier = Notifier()
+        try:
+            own_notifier.send_email(subject, email_context, recipients)
+        finally:
+            own_notifier.close()
+
+    return [
+        Stage('portfolio', portfolio, deps=['sheet', 'market', 'indicators']),
+        Stage('risk', risk, deps=['portfolio', 'market']),
+        Stage('ai', ai, deps=['portfolio', 'risk', 'indicators', 'news']),
+        Stage('chart', chart, deps=['portfolio']),
+        Stage('email', email, deps=['portfolio', 'risk', 'ai', 'chart', 'indicators'])
+    ]
+
+def send_portfolio_report(portfolio_data, market_data, indicators, news_summary, **options):
+    """Values one portfolio against already-fetched market data, then analyzes and emails it."""
+    run_stages(
+        report_stages(**options),
+        results={'sheet': portfolio_data, 'market': market_data, 'indicators': indicators, 'news': news_summary},
+        max_workers=Settings.PIPELINE_WORKERS
+    )
+
+def job():
+    logger.info("Starting daily financial report job...")
+    metrics.reset()
+    try:
+        def sheet(r):
+            # 1. Load Portfolio from Sheets
+            from src.sheets_manager import SheetsManager
+            portfolio_data = SheetsManager.get_portfolio_from_sheets()
+            if not portfolio_data:
+                raise PipelineAbort("Failed to load portfolio data. Aborting.")
+            return portfolio_data
+
+        def indicators(r):
+            from src.indicators import IndicatorsProvider
+            return IndicatorsProvider().get()
+
+        def news(r):
+            from src.news_collector import NewsCollector
+            return NewsCollector().get_top_news()
+
+        def market(r):
+            from src.data_collector import DataCollector
+            return DataCollector(r['sheet']).get_market_data()
+
+        # 2. Data Collection (news and BCB do not depend on the sheet and start right away)
+        stages = [
+            Stage('sheet', sheet),
+            Stage('indicators', indicators),
+            Stage('news', news),
+            Stage('market', market, deps=['sheet']),
+            *report_stages()
+        ]
+        run_stages(stages, max_workers=Settings.PIPELINE_WORKERS)
         
         logger.info("Job completed successfully.")
+
+    except PipelineAbort as e:
+        logger.error(str(e))
         
     except Exception as e:
         logger.error(f"Job failed: {e}", exc_info=True)
         sys.exit(1)
 
+    finally:
+        outbound.log_summary()
+        metrics.write()
+
+def batch_job(config_path):
+    """
+    Runs the report for several portfolios (e.g. one per client sheet).
+    `config_path` is a JSON list of objects with `sheet_url` and optionally
+    `name`, `recipients`, `target_allocation` and `contribution_amount`
+    (see config/portfolios.example.json). Market data is fetched once for
+    the union of all tickers; indicators and news once per batch.
+    """
+    logger.info(f"Starting batch report job from {config_path}...")
+    metrics.reset()
+    try:
+        from src.sheets_manager import SheetsManager
+
+        with open(config_path, 'r') as f:
+            configs = json.load(f)
+
+        # 1. Load every sheet
+        portfolios = []
+        for i, config in enumerate(configs):
+            name = config.get('name', f"portfolio-{i + 1}")
+            portfolio_data = SheetsManager.get_portfolio_from_sheets(config['sheet_url'])
+            if not portfolio_data:
+                logger.error(f"[{name}] Failed to load portfolio data. Skipping.")
+                continue
+            portfolios.append((name, config, portfolio_data))
+
+        if not portfolios:
+            logger.error("No portfolio could be loaded. Aborting.")
+            return
+
+        # 2. Shared Data Collection (distinct tickers only)
+        union = {}
+        for _, _, portfolio_data in portfolios:
+            for item in portfolio_data:
+                union.setdefault(item['ticker'], item)
+        logger.info(f"Batch: {len(portfolios)} portfolios, {len(union)} distinct tickers.")
+
+        from src.data_collector import DataCollector
+        from src.news_collector import NewsCollector
+        from src.notifier import Notifier
+
+        collector = DataCollector(list(union.values()))
+        market_data = collector.get_market_data()
+        indicators = collector.get_economic_indicators()
+        news_summary = NewsCollector().get_top_news()
+
+        # 3. Fan out per portfolio
+        if Settings.GEMINI_API_KEY:
+            from src.ai_analyst import AIAnalyst
+            analyst = AIAnalyst()
+        else:
+            analyst = None
+        # One SMTP connection for the whole batch
+        notifier = Notifier()
+        failed = []
+        try:
+            for name, config, portfolio_data in portfolios:
+                try:
+                    logger.info(f"[{name}] Generating report...")
+                    send_portfolio_report(
+                        portfolio_data, market_data, indicators, news_summary,
+                        recipients=config.get('recipients'),
+                        target_allocation=config.get('target_allocation'),
+                        history_path=os.path.join("data", "history", re.sub(r'[^\w.-]', '_', name) + ".jsonl"),
+                        contribution_amount=config.get('contribution_amount', 250.00),
+                        analyst=analyst, notifier=notifier
+                    )
+                except Exception as e:
+                    logger.error(f"[{name}] Report failed: {e}", exc_info=True)
+                    failed.append(name)
+        finally:
+            notifier.close()
+
+        skipped = len(configs) - len(portfolios)
+        logger.info(f"Batch completed: {len(portfolios) - len(failed)} sent, {len(failed)} failed, {skipped} skipped.")
+        if failed:
+            sys.exit(1)
+
+    except Exception as e:
+        logger.error(f"Batch job failed: {e}", exc_info=True)
+        sys.exit(1)
+
+    finally:
+        outbound.log_summary()
+        metrics.write()
+
+def watch():
+    """
+    Daemon mode: keeps the portfolio, price panel, fundamentals and
+    indicators in memory, refreshes quotes every WATCH_REFRESH_MINUTES and
+    sends the report daily at WATCH_REPORT_TIME (see src/watch.py).
+    """
+    from src.watch import PortfolioWatcher
+    try:
+        PortfolioWatcher(report=send_portfolio_report).run()
+    except KeyboardInterrupt:
+        logger.info("Watch stopped.")
+
+def backtest(years, config_path=None):
+    """
+    Replays the rebalancing threshold and the contribution rule over the
+    last `years` of prices for the sheet's tickers, for a grid of
+    thresholds, monthly contributions and target mixes (the batch config's
+    target allocations, when given). Logs the results sorted by return.
+    """
+    from src.sheets_manager import SheetsManager
+    from src.backtest import Backtester, load_history
+
+    portfolio_data = SheetsManager.get_portfolio_from_sheets()
+    if not portfolio_data:
+        logger.error("Failed to load portfolio data. Aborting.")
+        return
+
+    targets = {"default": Settings.TARGET_ALLOCATION}
+    if config_path:
+        with open(config_path, 'r') as f:
+            for i, config in enumerate(json.load(f)):
+                if config.get('target_allocation'):
+                    targets[config.get('name', f"portfolio-{i + 1}")] = config['target_allocation']
+
+    prices, categories, cdi, weights = load_history(portfolio_data, years)
+    backtester = Backtester(prices, categories, cdi, weights)
+    combinations = Backtester.grid([2.5, 5, 7.5, 10, 15, 100], [0, 250, 500, 1000, 2500], targets)
+    results = backtester.run(combinations, targets)
+    logger.info(f"Backtest over {years} years, {len(results)} combinations:\n"
+                + results.sort_values('annual_return_pct', ascending=False).to_string(index=False, float_format="{:,.2f}".format))
+
+def validate(config_path=None):
+    """
+    Dry run: checks the settings and downloads/parses the sheet(s) without
+    loading the data-science stack, collecting market data or sending
+    anything. Returns True when no error was found.
+    """
+    from src.sheets_manager import SheetsManager
+
+    errors = []
+    for name in ("EMAIL_SENDER", "EMAIL_PASSWORD", "EMAIL_RECEIVER"):
+        if not getattr(Settings, name):
+            errors.append(f"{name} is not set.")
+    if not Settings.GEMINI_API_KEY:
+        logger.warning("GEMINI_API_KEY is not set: the report will be sent without the AI analysis.")
+    if Settings.CHART_FORMAT.lower() not in ("png", "svg"):
+        errors.append(f"CHART_FORMAT must be 'png' or 'svg', got '{Settings.CHART_FORMAT}'.")
+
+    sheets = [("default", Settings.SHEET_CSV_URL, Settings.TARGET_ALLOCATION)]
+    if config_path:
+        try:
+            with open(config_path, 'r') as f:
+                configs = json.load(f)
+            sheets = [
+                (config.get('name', f"portfolio-{i + 1}"), config.get('sheet_url'),
+                 config.get('target_allocation') or Settings.TARGET_ALLOCATION)
+                for i, config in enumerate(configs)
+            ]
+        except Exception as e:
+            errors.append(f"Could not read batch config {config_path}: {e}")
+            sheets = []
+
+    for name, url, target_allocation in sheets:
+        total_target = sum(target_allocation.values())
+        if abs(total_target - 1) > 0.001:
+            errors.append(f"[{name}] Target allocation sums to {total_target:.1%}, expected 100%.")
+        unknown = set(target_allocation) - set(Settings.CATEGORY_MAP.values())
+        if unknown:
+            errors.append(f"[{name}] Unknown target allocation classes: {sorted(unknown)}")
+
+        if not url:
+            errors.append(f"[{name}] No sheet URL configured.")
+            continue
+        positions, problems = SheetsManager.validate_sheet(url)
+        errors.extend(f"[{name}] {problem}" for problem in problems)
+        logger.info(f"[{name}] Sheet checked: {positions} positions, {len(problems)} problems.")
+
+    for error in errors:
+        logger.error(error)
+    logger.info("Validation passed." if not errors else f"Validation failed with {len(errors)} errors.")
+    return not errors
+
 if __name__ == "__main__":
-    job()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Invest-AI daily portfolio report.")
+    parser.add_argument("--batch", metavar="PATH", help="JSON list of portfolios to report on (see config/portfolios.example.json)")
+    parser.add_argument("--validate", "--dry-run", action="store_true", dest="validate",
+                        help="check the settings and the sheet(s) without collecting data or sending e-mail")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running: refresh quotes on an interval and send the report at WATCH_REPORT_TIME")
+    parser.add_argument("--backtest", metavar="YEARS", type=float,
+                        help="replay the rebalancing and contribution rules over the last YEARS of prices")
+    parser.add_argument("--profile-imports", action="store_true",
+                        help="run normally and report the import time per package at the end")
+    args = parser.parse_args()
+
+    if args.profile_imports:
+        from src.import_profile import run_profiled
+        sys.exit(run_profiled([a for a in sys.argv if a != "--profile-imports"]))
+    elif args.validate:
+        sys.exit(0 if validate(args.batch) else 1)
+    elif args.watch:
+        watch()
+    elif args.backtest:
+        backtest(args.backtest, args.batch)
+    elif args.batch:
+        batch_job(args.batch)
+    else:
+        job()
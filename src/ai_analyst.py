@@ -1,10 +1,66 @@
 from google import genai
+from google.genai import types
 import logging
 import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from config.settings import Settings
+from src.metrics import metrics
+from src.ai_cache import AIResponseCache
+from src.prompt_builder import PromptBuilder
 
 logger = logging.getLogger(__name__)
 
+class ModelStats:
+    """
+    Recent latency and error rate per model (exponentially weighted),
+    persisted between runs so the next run can try the healthiest model first.
+    """
+    ALPHA = 0.3
+    MIN_SAMPLES = 3
+
+    def __init__(self, path=None):
+        self.path = path or Settings.AI_MODEL_STATS_PATH
+        self.stats = {}
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    self.stats = json.load(f)
+        except Exception as e:
+            logger.warning(f"Failed to load AI model stats: {e}")
+
+    def record(self, model_id, latency, ok):
+        entry = self.stats.setdefault(model_id, {"latency": latency, "error_rate": 0.0, "samples": 0})
+        entry["latency"] = (1 - self.ALPHA) * entry["latency"] + self.ALPHA * latency
+        entry["error_rate"] = (1 - self.ALPHA) * entry["error_rate"] + self.ALPHA * (0.0 if ok else 1.0)
+        entry["samples"] += 1
+
+    def order(self, model_ids):
+        """
+        Sorts by expected cost (latency inflated by error rate). Models with
+        fewer than MIN_SAMPLES samples are neutral: they get the median cost
+        of the sampled ones. Ties keep the given order.
+        """
+        costs = {
+            m: self.stats[m]["latency"] * (1 + 4 * self.stats[m]["error_rate"])
+            for m in model_ids if self.stats.get(m, {}).get("samples", 0) >= self.MIN_SAMPLES
+        }
+        if not costs:
+            return list(model_ids)
+        ranked = sorted(costs.values())
+        middle = len(ranked) // 2
+        neutral = ranked[middle] if len(ranked) % 2 else (ranked[middle - 1] + ranked[middle]) / 2
+        return sorted(model_ids, key=lambda m: costs.get(m, neutral))
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, 'w') as f:
+                json.dump(self.stats, f, indent=2)
+        except Exception as e:
+            logger.error(f"Failed to save AI model stats: {e}")
+
 class AIAnalyst:
     def __init__(self):
         self.api_key = Settings.GEMINI_API_KEY
@@ -14,51 +70,112 @@ class AIAnalyst:
             'gemini-2.0-flash-lite'
         ]
         
+        self.cache = AIResponseCache() if Settings.AI_CACHE_ENABLED else None
+        self.model_stats = ModelStats()
+        self.models_to_try = self.model_stats.order(self.models_to_try)
+
         if self.api_key:
             self.client = genai.Client(api_key=self.api_key)
         else:
             self.client = None
             logger.warning("GEMINI_API_KEY não configurada. A análise de IA será pulada.")
 
-    def generate_ai_analysis(self, portfolio_df, total_value, indicators, news_summary):
+    def generate_ai_analysis(self, portfolio_df, total_value, indicators, news_summary, risk=None, target_allocation=None):
         if not self.client:
             return "Análise de IA indisponível (Chave API não configurada)."
 
-        portfolio_summary = portfolio_df.to_dict(orient='records')
-        summary_text = f"Valor Total: R$ {total_value:,.2f}\n"
-        summary_text += f"Indicadores: Selic {indicators.get('selic_meta')}% | CDI {indicators.get('cdi')}% | PTAX {indicators.get('ptax_venda')}\n"
-        summary_text += "Ativos:\n"
-        
-        for item in portfolio_summary:
-            summary_text += (f"- {item['ticker']} ({item['category']}): R$ {item['value_brl']:.2f} "
-                            f"({item['allocation']:.1f}%) | L/P: {item.get('profit_loss_pct', 0):.2f}% | "
-                            f"P/L: {item.get('pe', 0):.1f} | ROE: {item.get('roe', 0):.1f}% | Rec: {item.get('recommendation', 'N/A')}\n")
+        full_prompt, prompt_tokens = PromptBuilder(target_allocation=target_allocation).build(portfolio_df, total_value, indicators, news_summary, risk)
+        logger.info(f"Prompt da análise: ~{prompt_tokens} tokens estimados ({len(portfolio_df)} ativos).")
+        metrics.observe("ai.prompt_tokens", "estimated", prompt_tokens)
 
-        full_prompt = f"""
-        Você é um Gestor de Portfólio Sênior. Analise a carteira com base no contexto:
-        
-        NOTÍCIAS DO DIA:
-        {news_summary}
+        if self.cache:
+            cached = self.cache.lookup(full_prompt, self.models_to_try)
+            if cached:
+                logger.info(f"Análise de IA reaproveitada do cache ({cached[0]}).")
+                metrics.incr("cache.ai.hit")
+                self.cache.save()
+                return cached[1]
+            metrics.incr("cache.ai.miss")
 
-        DADOS DA CARTEIRA:
-        {summary_text}
-        
-        Gere uma análise direta e executiva sobre o que fazer hoje.
-        """
+        return self._hedged_generate(full_prompt)
 
-        for model_id in self.models_to_try:
-            try:
-                logger.info(f"Tentando análise com o modelo: {model_id}")
-                response = self.client.models.generate_content(
-                    model=model_id,
-                    contents=full_prompt
+    def _call_model(self, model_id, prompt, timeout):
+        logger.info(f"Tentando análise com o modelo: {model_id}")
+        with metrics.span("ai.generate", model=model_id):
+            response = self.client.models.generate_content(
+                model=model_id,
+                contents=prompt,
+                config=types.GenerateContentConfig(
+                    http_options=types.HttpOptions(timeout=max(1, int(timeout * 1000)))
                 )
-                
-                if response and response.text:
-                    return response.text
-                
-            except Exception as e:
-                logger.error(f"Erro com o modelo {model_id}: {e}")
-                if model_id == self.models_to_try[-1]:
-                    return "Análise de IA temporariamente indisponível (Erro de conexão/cota)."
-                continue
\ No newline at end of file
+            )
+        if not (response and response.text):
+            raise ValueError("resposta vazia")
+        return response.text
+
+    def _hedged_generate(self, prompt):
+        """
+        Sends the prompt to the first model and, if no answer arrives within
+        AI_HEDGE_DELAY_SECONDS (or it fails), fires the next model while the
+        first keeps running. The first good answer wins and the others are
+        abandoned. Everything is bounded by AI_DEADLINE_SECONDS: each request
+        gets the time left until the deadline as its HTTP timeout, so an
+        abandoned request ends by then too (until it does, its worker thread
+        still holds interpreter exit).
+        """
+        hedge_delay = Settings.AI_HEDGE_DELAY_SECONDS if Settings.AI_HEDGE_ENABLED else None
+        deadline = time.monotonic() + Settings.AI_DEADLINE_SECONDS
+        queue = list(self.models_to_try)
+        executor = ThreadPoolExecutor(max_workers=len(queue), thread_name_prefix="ai")
+        running = {}
+        next_launch = time.monotonic()
+        after_failure = False
+
+        try:
+            while queue or running:
+                now = time.monotonic()
+                if now >= deadline:
+                    for model_id, started in running.values():
+                        logger.error(f"Modelo {model_id} excedeu o prazo global da análise.")
+                        self.model_stats.record(model_id, now - started, ok=False)
+                    break
+
+                # Launch the next model when nothing is in flight or the hedge delay expired
+                if queue and (not running or (hedge_delay is not None and now >= next_launch)):
+                    model_id = queue.pop(0)
+                    if running and not after_failure:
+                        metrics.incr("ai.hedges")
+                        logger.info(f"Sem resposta após {hedge_delay}s, disparando requisição paralela com {model_id}.")
+                    after_failure = False
+                    running[executor.submit(self._call_model, model_id, prompt, deadline - now)] = (model_id, now)
+                    next_launch = now + (hedge_delay or 0)
+
+                timeout = deadline - now
+                if queue and hedge_delay is not None:
+                    timeout = min(timeout, max(0.0, next_launch - now))
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    model_id, started = running.pop(future)
+                    latency = time.monotonic() - started
+                    try:
+                        text = future.result()
+                    except Exception as e:
+                        logger.error(f"Erro com o modelo {model_id}: {e}")
+                        metrics.incr("ai.retries")
+                        self.model_stats.record(model_id, latency, ok=False)
+                        # A failure should not wait for the hedge delay
+                        next_launch = time.monotonic()
+                        after_failure = True
+                        continue
+
+                    self.model_stats.record(model_id, latency, ok=True)
+                    if self.cache:
+                        self.cache.store(prompt, model_id, text)
+                    return text
+        finally:
+            # Losers are abandoned (their timeout ends at the deadline); stats are kept for the next run
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.model_stats.save()
+
+        return "Análise de IA temporariamente indisponível (Erro de conexão/cota)."
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import re
+import logging
+from datetime import datetime, timedelta
+from config.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+# Numbers as they appear in the prompt: 5,253.09 | -1.25 | 15.0 | 3
+NUMBER_RE = re.compile(r'-?\d+(?:,\d{3})*(?:\.\d+)?')
+
+class AIResponseCache:
+    """
+    Persistent cache of Gemini answers keyed on sha256(model id + normalized prompt).
+
+    With a tolerance > 0 a second, fuzzy key is also kept: the prompt with
+    every number masked out. A cached answer is then reused when the
+    masked prompt is identical and every number is within the relative
+    tolerance (e.g. prices that moved 0.3% with AI_CACHE_TOLERANCE_PCT=1).
+    Entries expire after AI_CACHE_TTL_HOURS; the file keeps at most
+    AI_CACHE_MAX_ENTRIES answers, evicting the least recently used.
+    """
+
+    def __init__(self, path=None, ttl_hours=None, max_entries=None, tolerance_pct=None):
+        self.path = path or Settings.AI_CACHE_PATH
+        self.ttl = timedelta(hours=Settings.AI_CACHE_TTL_HOURS if ttl_hours is None else ttl_hours)
+        self.max_entries = max_entries or Settings.AI_CACHE_MAX_ENTRIES
+        self.tolerance = (Settings.AI_CACHE_TOLERANCE_PCT if tolerance_pct is None else tolerance_pct) / 100
+        self.entries = self._load()
+
+    @staticmethod
+    def normalize(prompt):
+        """Collapses indentation and blank-line differences that do not change the prompt's meaning."""
+        lines = (" ".join(line.split()) for line in prompt.strip().splitlines())
+        return "\n".join(line for line in lines if line)
+
+    @staticmethod
+    def _digest(*parts):
+        return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _numbers(text):
+        return [float(match.replace(",", "")) for match in NUMBER_RE.findall(text)]
+
+    def _load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.warning(f"Failed to load AI cache, starting empty: {e}")
+        return {}
+
+    def _fresh(self, entry, now):
+        return now - datetime.fromisoformat(entry["created_at"]) < self.ttl
+
+    def _within_tolerance(self, cached, current):
+        if len(cached) != len(current):
+            return False
+        return all(
+            abs(a - b) <= self.tolerance * max(abs(a), abs(b))
+            for a, b in zip(cached, current)
+        )
+
+    def lookup(self, prompt, model_ids):
+        """Returns (model_id, response) for the first model with a usable cached answer, else None."""
+        now = datetime.now()
+        normalized = self.normalize(prompt)
+        numbers = self._numbers(normalized) if self.tolerance > 0 else None
+        template = NUMBER_RE.sub("#", normalized)
+
+        for model_id in model_ids:
+            entry = self.entries.get(self._digest(model_id, normalized))
+            if entry and self._fresh(entry, now):
+                entry["last_used"] = now.isoformat(timespec='seconds')
+                return model_id, entry["response"]
+
+            if self.tolerance > 0:
+                template_key = self._digest(model_id, template)
+                for entry in self.entries.values():
+                    if (entry.get("template_key") == template_key and self._fresh(entry, now)
+                            and self._within_tolerance(entry["numbers"], numbers)):
+                        entry["last_used"] = now.isoformat(timespec='seconds')
+                        return model_id, entry["response"]
+        return None
+
+    def store(self, prompt, model_id, response):
+        now = datetime.now().isoformat(timespec='seconds')
+        normalized = self.normalize(prompt)
+        self.entries[self._digest(model_id, normalized)] = {
+            "model": model_id,
+            "created_at": now,
+            "last_used": now,
+            "template_key": self._digest(model_id, NUMBER_RE.sub("#", normalized)),
+            "numbers": self._numbers(normalized),
+            "response": response
+        }
+        self.save()
+
+    def save(self):
+        now = datetime.now()
+        self.entries = {key: entry for key, entry in self.entries.items() if self._fresh(entry, now)}
+        if len(self.entries) > self.max_entries:
+            by_use = sorted(self.entries, key=lambda key: self.entries[key]["last_used"])
+            for key in by_use[:len(self.entries) - self.max_entries]:
+                del self.entries[key]
+
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Failed to save AI cache: {e}")
@@ -0,0 +1,151 @@
+import bisect
+import logging
+import numpy as np
+import pandas as pd
+from config.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+class ContributionAllocator:
+    """
+    Turns a contribution budget into whole-lot buy orders per ticker.
+
+    The goal is the post-trade allocation closest (sum of squared
+    deviations, in R$) to the target allocation:
+
+    1. Water-filling: the budget is split across underweight classes so
+       that every class that receives money ends up with the same residual
+       gap (the continuous optimum).
+    2. Each class buys whole lots of the ticker whose lot price leaves the
+       least cash unspent (ties go to the smaller position).
+    3. The leftover cash is spent greedily, always on the lot with the
+       largest reduction in squared deviation, until nothing affordable
+       still improves the allocation.
+
+    Stocks, FIIs, ETFs and US assets are bought in whole shares; classes in
+    CONTRIBUTION_FRACTIONAL_CATEGORIES (fixed income, crypto) in steps of
+    CONTRIBUTION_FRACTIONAL_STEP reais. Following the portfolio rule, fixed
+    income gets nothing while it is above RF_PRIORITY_THRESHOLD percent.
+    Cost is O(n log n) in the number of positions plus a few steps per class.
+    """
+
+    RF_CLASS = "Renda Fixa"
+
+    def __init__(self, target_allocation=None, fractional_categories=None, fractional_step=None,
+                 rf_priority_threshold=None):
+        self.target_alloc = target_allocation or Settings.TARGET_ALLOCATION
+        self.fractional_categories = fractional_categories or Settings.CONTRIBUTION_FRACTIONAL_CATEGORIES
+        self.fractional_step = fractional_step or Settings.CONTRIBUTION_FRACTIONAL_STEP
+        self.rf_priority_threshold = Settings.RF_PRIORITY_THRESHOLD if rf_priority_threshold is None else rf_priority_threshold
+
+    @staticmethod
+    def water_fill(gaps, budget):
+        """Spend per class minimizing sum((gap - spend)^2) with sum(spend) <= budget and spend >= 0."""
+        gaps = np.maximum(np.asarray(gaps, dtype=float), 0.0)
+        if gaps.sum() <= budget:
+            return gaps
+        ordered = np.sort(gaps)[::-1]
+        cumulative = np.cumsum(ordered)
+        # Largest k such that the k biggest gaps all stay above the common level
+        levels = (cumulative - budget) / np.arange(1, len(ordered) + 1)
+        k = np.nonzero(ordered > levels)[0][-1]
+        return np.maximum(gaps - levels[k], 0.0)
+
+    def allocate(self, positions, total_value, amount):
+        """
+        `positions` is the valued portfolio (PortfolioManager.value_positions).
+        Returns (orders, leftover): a DataFrame with ticker, category, class,
+        shares, price (R$ per share), lots and cost, and the unspent cash.
+        """
+        empty = pd.DataFrame(columns=['ticker', 'category', 'class', 'shares', 'price', 'lots', 'cost'])
+        if positions.empty or amount <= 0:
+            return empty, float(max(amount, 0.0))
+
+        categories = positions['category'].to_numpy()
+        classes = positions['category'].map(Settings.CATEGORY_MAP).to_numpy()
+        qty = positions['qty'].to_numpy(dtype=float)
+        value = positions['value_brl'].to_numpy(dtype=float)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            unit_price = np.where(qty > 0, value / qty, 0.0)
+        fractional = np.isin(categories, self.fractional_categories)
+        lot_price = np.where(fractional, self.fractional_step, unit_price)
+        buyable = np.isfinite(unit_price) & (unit_price > 0) & pd.notna(classes)
+
+        current = pd.Series(value).groupby(classes).sum()
+        final_total = total_value + amount
+        names = [name for name in self.target_alloc]
+        gaps = np.array([self.target_alloc[name] * final_total - current.get(name, 0.0) for name in names])
+
+        excluded = set()
+        rf_pct = current.get(self.RF_CLASS, 0.0) / total_value * 100 if total_value else 0.0
+        if rf_pct > self.rf_priority_threshold:
+            excluded.add(self.RF_CLASS)
+
+        # Lots available per class, sorted by price for the greedy phase
+        members = {}
+        for c, name in enumerate(names):
+            idx = np.nonzero(buyable & (classes == name))[0]
+            if name in excluded or gaps[c] <= 0 or idx.size == 0:
+                gaps[c] = min(gaps[c], 0.0)
+                continue
+            members[c] = idx[np.lexsort((value[idx], lot_price[idx]))]
+
+        lots = np.zeros(len(positions), dtype=np.int64)
+        bought = np.zeros(len(names))
+        budget = float(amount)
+
+        # 1-2. Continuous optimum per class, rounded down to whole lots of the best-fitting ticker
+        spend = self.water_fill(gaps, budget)
+        for c, idx in members.items():
+            prices = lot_price[idx]
+            fits = idx[prices <= spend[c] + 1e-9]
+            if fits.size == 0:
+                continue
+            remainder = np.mod(spend[c], lot_price[fits])
+            best = fits[np.lexsort((value[fits], remainder))[0]]
+            count = int((spend[c] + 1e-9) // lot_price[best])
+            lots[best] += count
+            bought[c] += count * lot_price[best]
+            budget -= count * lot_price[best]
+
+        # 3. Greedy on the leftover: the lot that most reduces (gap - bought)^2, several at a time when they all help
+        price_lists = {c: lot_price[idx].tolist() for c, idx in members.items()}
+        while budget > 1e-9:
+            best_gain, choice = 0.0, None
+            for c, idx in members.items():
+                residual = gaps[c] - bought[c]
+                if residual <= 0:
+                    continue
+                prices = price_lists[c]
+                affordable = bisect.bisect_right(prices, budget + 1e-9)
+                nearest = bisect.bisect_left(prices, residual, 0, affordable)
+                for j in (nearest - 1, nearest):
+                    if 0 <= j < affordable:
+                        gain = prices[j] * (2 * residual - prices[j])
+                        if gain > best_gain + 1e-12:
+                            best_gain, choice = gain, (c, idx[j], residual)
+            if choice is None:
+                break
+
+            c, i, residual = choice
+            count = max(1, min(int((budget + 1e-9) // lot_price[i]), int(residual / lot_price[i] + 0.5)))
+            lots[i] += count
+            bought[c] += count * lot_price[i]
+            budget -= count * lot_price[i]
+
+        chosen = np.nonzero(lots)[0]
+        if chosen.size == 0:
+            return empty, float(amount)
+
+        cost = lots[chosen] * lot_price[chosen]
+        orders = pd.DataFrame({
+            'ticker': positions['ticker'].to_numpy()[chosen],
+            'category': categories[chosen],
+            'class': classes[chosen],
+            'shares': np.where(fractional[chosen], cost / unit_price[chosen], lots[chosen]),
+            'price': unit_price[chosen],
+            'lots': lots[chosen],
+            'cost': cost
+        }).sort_values('cost', ascending=False, ignore_index=True)
+        return orders, float(amount - cost.sum())
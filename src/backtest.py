@@ -0,0 +1,225 @@
+import logging
+import itertools
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from config.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+class Backtester:
+    """
+    Replays the portfolio rules over a daily price history: a monthly
+    contribution split like PortfolioManager.suggest_contribution (gap
+    proportional, no fixed income while it is above RF_PRIORITY_THRESHOLD)
+    and a full rebalance to target whenever a class drifts more than the
+    threshold, as in get_rebalancing_suggestions.
+
+    Assets are aggregated per allocation class into a daily index (weighted
+    mean of the available returns, in BRL; fixed income follows the CDI).
+    Holdings are kept in units of those indexes, so between two monthly
+    events the value path of every parameter combination is a single matrix
+    product; Python only loops over months. All combinations run together
+    as rows of (combinations x classes) arrays.
+    """
+
+    RF_CLASS = "Renda Fixa"
+    USD_CATEGORIES = ["US_REITS", "US_STOCKS"]
+
+    def __init__(self, prices, categories, cdi=None, weights=None):
+        """
+        `prices`: daily closes indexed by date, one column per ticker, in the
+        ticker's own currency ('BRL=X', when present, converts USD assets).
+        `categories`: {ticker: sheet category}. `cdi`: daily CDI in % per day
+        (SGS series 12) indexed by date. `weights`: optional {ticker: weight}
+        within its class (e.g. current value); equal weights by default.
+        """
+        self.classes = list(dict.fromkeys(Settings.CATEGORY_MAP.values()))
+        prices = prices.sort_index()
+        self.dates = pd.DatetimeIndex(prices.index)
+        self.index = self._class_index(prices, categories, cdi, weights or {})
+
+    @classmethod
+    def is_usd(cls, ticker, category):
+        # Same rule as PortfolioManager.value_positions: -BRL crypto pairs are already in BRL
+        return category in cls.USD_CATEGORIES or (category == "CRYPTO" and not ticker.endswith("-BRL"))
+
+    def _class_index(self, prices, categories, cdi, weights):
+        """(days x classes) value index of each class, starting at 1."""
+        fx = prices['BRL=X'].ffill().bfill() if 'BRL=X' in prices else None
+        tickers = [t for t in prices.columns if t in categories and categories[t] in Settings.CATEGORY_MAP
+                   and categories[t] != "RENDA_FIXA"]
+
+        closes = prices[tickers].ffill()
+        is_usd = np.array([self.is_usd(t, categories[t]) for t in tickers], dtype=bool)
+        if is_usd.any():
+            if fx is None:
+                logger.warning("No BRL=X history: USD assets are backtested without FX.")
+            else:
+                closes.loc[:, is_usd] = closes.loc[:, is_usd].mul(fx, axis=0)
+
+        values = closes.to_numpy(dtype=float)
+        returns = np.full_like(values, np.nan)
+        if len(values) > 1:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                returns[1:] = values[1:] / values[:-1] - 1
+        returns[~np.isfinite(returns)] = np.nan
+
+        # Weighted mean of the returns available each day, per class
+        membership = np.zeros((len(tickers), len(self.classes)))
+        for j, t in enumerate(tickers):
+            membership[j, self.classes.index(Settings.CATEGORY_MAP[categories[t]])] = 1.0
+        w = np.array([weights.get(t, 1.0) for t in tickers], dtype=float)
+        available = ~np.isnan(returns)
+        numerator = (np.where(available, returns, 0.0) * w) @ membership
+        denominator = (available * w) @ membership
+        with np.errstate(divide='ignore', invalid='ignore'):
+            class_returns = np.where(denominator > 0, numerator / denominator, 0.0)
+
+        # Fixed income compounds the CDI on the days it was published
+        if cdi is not None and len(cdi):
+            growth = (1 + cdi.sort_index().astype(float) / 100).cumprod()
+            growth.index = pd.DatetimeIndex(growth.index)
+            growth = growth.reindex(growth.index.union(self.dates)).ffill().reindex(self.dates).fillna(1.0)
+            rf_returns = np.ones(len(self.dates))
+            rf_returns[1:] = growth.to_numpy()[1:] / growth.to_numpy()[:-1]
+            class_returns[:, self.classes.index(self.RF_CLASS)] = rf_returns - 1
+        else:
+            logger.warning("No CDI history: fixed income is backtested at 0%.")
+
+        class_returns[0] = 0.0
+        return np.cumprod(1 + class_returns, axis=0)
+
+    def event_days(self):
+        """Row of the first trading day of every month after the first one."""
+        months = self.dates.year * 12 + self.dates.month
+        return np.nonzero(np.diff(months.to_numpy()) != 0)[0] + 1
+
+    @staticmethod
+    def grid(thresholds, contributions, targets):
+        """
+        Every combination of the given thresholds (p.p.), monthly
+        contributions (R$) and target mixes ({name: allocation}).
+        Returns a DataFrame with columns threshold, contribution and target.
+        """
+        rows = list(itertools.product(thresholds, contributions, targets))
+        return pd.DataFrame(rows, columns=['threshold', 'contribution', 'target'])
+
+    def run(self, combinations, targets, initial_value=10000.0):
+        """
+        Simulates every row of `combinations` (see `grid`). `targets` maps the
+        names in the target column to allocation dicts. Each run starts with
+        `initial_value` invested at its target mix. Returns `combinations`
+        with final_value, invested, total_return_pct (time-weighted),
+        annual_return_pct, max_drawdown_pct, turnover_pct (sold per year,
+        over the average value) and rebalances.
+        """
+        k = len(combinations)
+        rf = self.classes.index(self.RF_CLASS)
+        threshold = combinations['threshold'].to_numpy(dtype=float)
+        contribution = combinations['contribution'].to_numpy(dtype=float)
+        mixes = {name: np.array([alloc.get(c, 0.0) for c in self.classes]) for name, alloc in targets.items()}
+        target = np.stack([mixes[name] for name in combinations['target']]) if k else np.zeros((0, len(self.classes)))
+
+        index = self.index
+        units = initial_value * target / index[0]
+        twr = np.ones(k)
+        peak = np.ones(k)
+        max_drawdown = np.zeros(k)
+        sold = np.zeros(k)
+        value_sum = np.zeros(k)
+        rebalances = np.zeros(k, dtype=np.int64)
+
+        events = self.event_days()
+        bounds = [0, *events.tolist(), len(index) - 1]
+        for start, end, is_event in zip(bounds[:-1], bounds[1:], [True] * len(events) + [False]):
+            # Daily value of every combination over the period, from the holdings set at `start`
+            path = units @ index[start:end + 1].T
+            base = path[:, :1]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                curve = twr[:, None] * np.where(base > 0, path / base, 1.0)
+            running = np.maximum.accumulate(np.concatenate([peak[:, None], curve], axis=1), axis=1)[:, 1:]
+            max_drawdown = np.maximum(max_drawdown, (1 - curve / running).max(axis=1))
+            peak = running[:, -1]
+            twr = curve[:, -1]
+            if not is_event:
+                break
+
+            values = units * index[end]
+            total = values.sum(axis=1)
+            value_sum += total
+            with np.errstate(divide='ignore', invalid='ignore'):
+                pct = np.where(total[:, None] > 0, values / total[:, None] * 100, 0.0)
+            diff = pct - target * 100
+
+            # Threshold breached: sell overweight, buy underweight back to target (contribution included)
+            rebalance = (np.abs(diff) > threshold[:, None]).any(axis=1) & (total > 0)
+            rebalanced = target * (total + contribution)[:, None]
+
+            # Otherwise the contribution goes to underweight classes, in proportion to the gap
+            gap = np.where(diff < 0, -diff, 0.0)
+            gap[:, rf] = np.where(pct[:, rf] > Settings.RF_PRIORITY_THRESHOLD, 0.0, gap[:, rf])
+            gap_sum = gap.sum(axis=1, keepdims=True)
+            # A balanced portfolio (no gap) invests at the target mix instead of holding cash
+            with np.errstate(divide='ignore', invalid='ignore'):
+                share = np.where(gap_sum > 0, gap / gap_sum, target)
+            contributed = values + share * contribution[:, None]
+
+            new_values = np.where(rebalance[:, None], rebalanced, contributed)
+            sold += np.where(rebalance, np.clip(values - rebalanced, 0, None).sum(axis=1), 0.0)
+            rebalances += rebalance
+            units = new_values / index[end]
+
+        years = max((self.dates[-1] - self.dates[0]).days / 365.25, 1 / 365.25) if len(self.dates) else 1.0
+        final_value = units @ index[-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            turnover = np.where(value_sum > 0, sold / (value_sum / max(len(events), 1)) / years * 100, 0.0)
+
+        result = combinations.reset_index(drop=True).copy()
+        result['final_value'] = final_value
+        result['invested'] = initial_value + contribution * len(events)
+        result['total_return_pct'] = (twr - 1) * 100
+        result['annual_return_pct'] = (twr ** (1 / years) - 1) * 100
+        result['max_drawdown_pct'] = max_drawdown * 100
+        result['turnover_pct'] = turnover
+        result['rebalances'] = rebalances
+        return result
+
+def load_history(portfolio_data, years):
+    """
+    Downloads `years` of daily closes for the sheet tickers (plus BRL=X when
+    needed) and the daily CDI. Returns (prices, categories, cdi, weights),
+    the arguments of Backtester; weights are the positions' current values.
+    """
+    from bcb import sgs
+    from src.outbound import outbound
+    from src.data_collector import DataCollector
+
+    end = date.today()
+    start = end - timedelta(days=int(years * 365.25))
+    collector = DataCollector(portfolio_data)
+    prices = collector.download_prices(collector.quoted_tickers(), start.isoformat(), (end + timedelta(days=1)).isoformat())
+
+    # The BCB API serves at most 10 years of a daily series per request
+    chunks = []
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(end, chunk_start + timedelta(days=3650))
+        try:
+            chunks.append(outbound.call(
+                "bcb", sgs.get, {'cdi': Settings.BACKTEST_CDI_SERIES}, start=chunk_start.isoformat(), end=chunk_end.isoformat()
+            )['cdi'])
+        except Exception as e:
+            logger.error(f"Error fetching CDI history via BCB: {e}")
+        chunk_start = chunk_end + timedelta(days=1)
+    cdi = pd.concat(chunks).dropna() if chunks else None
+
+    categories = {item['ticker']: item.get('category', 'OUTROS') for item in portfolio_data}
+    last = prices.ffill().iloc[-1].fillna(0.0) if not prices.empty else pd.Series(dtype=float)
+    usd_rate = float(last.get('BRL=X', 1.0)) or 1.0
+    weights = {
+        item['ticker']: float(item['quantity']) * float(last[item['ticker']])
+        * (usd_rate if Backtester.is_usd(item['ticker'], item.get('category')) else 1.0)
+        for item in portfolio_data if item['ticker'] in last.index
+    }
+    return prices, categories, cdi, {t: w for t, w in weights.items() if w > 0}
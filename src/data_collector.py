@@ -1,14 +1,28 @@
 import yfinance as yf
 import pandas as pd
+import numpy as np
 import json
 import logging
 import requests
-from datetime import datetime
-from bcb import sgs, currency
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
 from config.settings import Settings
+from src.price_store import PriceStore
+from src.fundamentals_cache import FundamentalsCache
+from src.indicators import IndicatorsProvider
+from src.metrics import metrics
+from src.outbound import outbound, EmptyResultError
 
 logger = logging.getLogger(__name__)
 
+class MarketData(dict):
+    """
+    {ticker: market data} as returned by get_market_data, plus the one-year
+    close panel it was computed from (`history`), kept for RiskAnalyzer.
+    """
+    history = None
+
 class DataCollector:
     def __init__(self, portfolio_data):
         self.portfolio_data = portfolio_data
@@ -25,17 +39,320 @@ class DataCollector:
         if has_international and "BRL=X" not in self.tickers:
             self.tickers.append("BRL=X")
 
+    @staticmethod
+    def _is_fixed_income(ticker):
+        return ticker == "RDB-NUBANK" or ticker.startswith("RDB")
+
+    @staticmethod
+    def _normalize_dates(frame):
+        # Tickers trade on different calendars (B3, NYSE, crypto 24/7);
+        # normalize to plain local dates so rows line up across markets.
+        if isinstance(frame.index, pd.DatetimeIndex) and frame.index.tz is not None:
+            frame.index = frame.index.tz_localize(None)
+        frame.index = pd.to_datetime(frame.index).normalize()
+        return frame.groupby(level=0).last().sort_index()
+
+    @staticmethod
+    def _history(ticker, range_kwargs):
+        history = yf.Ticker(ticker).history(**range_kwargs)
+        if history.empty:
+            # Network errors, 429 and 5xx raise and are retried; an empty frame is either a
+            # missing ticker/range or throttling: retried a little, never counted by the breaker
+            raise EmptyResultError(f"empty history for {ticker}")
+        return history
+
+    @staticmethod
+    def _download_batch(chunk, range_kwargs):
+        data = yf.download(
+            chunk, auto_adjust=True, group_by='column',
+            threads=True, progress=False, **range_kwargs
+        )
+        if data.empty:
+            raise EmptyResultError(f"empty download for {len(chunk)} tickers")
+        return data
+
+    def _download_price_panel(self, tickers, **range_kwargs):
+        """
+        Downloads daily closes for the given tickers from Yahoo.
+        `range_kwargs` is passed to yfinance (`period=` or `start=`/`end=`).
+        Returns a DataFrame indexed by date with one column per ticker.
+        """
+        if not tickers:
+            return pd.DataFrame()
+
+        if not Settings.YF_BATCH_DOWNLOAD:
+            columns = {}
+            for ticker in tickers:
+                try:
+                    with metrics.span("yahoo.history", ticker=ticker):
+                        history = outbound.call("yahoo", self._history, ticker, range_kwargs)
+                    columns[ticker] = self._normalize_dates(history['Close'])
+                except Exception as e:
+                    logger.warning(f"Failed to fetch history for {ticker}: {e}")
+            return pd.DataFrame(columns).reindex(columns=tickers)
+
+        frames = []
+        batch_size = max(1, Settings.YF_BATCH_SIZE)
+        for i in range(0, len(tickers), batch_size):
+            chunk = tickers[i:i + batch_size]
+            logger.info(f"Downloading price history for {len(chunk)} tickers...")
+            try:
+                with metrics.span("yahoo.download", tickers=len(chunk)):
+                    data = outbound.call("yahoo", self._download_batch, chunk, range_kwargs)
+                close = data['Close'] if not data.empty else pd.DataFrame()
+                if isinstance(close, pd.Series):
+                    close = close.to_frame(name=chunk[0])
+            except Exception as e:
+                logger.warning(f"Failed to download history batch {chunk}: {e}")
+                close = pd.DataFrame()
+            frames.append(close.reindex(columns=chunk))
+
+        return self._normalize_dates(pd.concat(frames, axis=1))
+
+    def _fetch_price_panel(self, tickers):
+        """
+        Returns one year of daily closes for the given tickers.
+        With the price store enabled only the missing tail of each series is
+        downloaded and merged into data/cache; the panel is then read back
+        from the store.
+        """
+        if not Settings.PRICE_STORE_ENABLED:
+            return self._download_price_panel(tickers, period="1y")
+
+        today = datetime.now().date()
+        start = today - timedelta(days=365)
+        end = today + timedelta(days=1)  # yfinance `end` is exclusive
+
+        store = PriceStore()
+        try:
+            plan = store.plan_downloads(tickers, start, today)
+            cached = len(tickers) - sum(len(group) for group in plan.values())
+            logger.info(f"Price store: {cached} tickers fresh, {len(tickers) - cached} need update.")
+            metrics.incr("cache.prices.hit", cached)
+            metrics.incr("cache.prices.miss", len(tickers) - cached)
+
+            readjusted = []
+            for fetch_start, group in sorted(plan.items()):
+                overlap_start = fetch_start - timedelta(days=Settings.PRICE_STORE_OVERLAP_DAYS)
+                fresh = self._download_price_panel(group, start=max(start, overlap_start).isoformat(), end=end.isoformat())
+                if fetch_start > start:
+                    readjusted += store.find_adjusted(fresh, before=fetch_start)
+                store.upsert(fresh, fetch_start, today)
+
+            # A split or dividend re-bases Yahoo's adjusted closes; refetch those series in full
+            if readjusted:
+                logger.info(f"Adjusted closes changed for {readjusted}, re-downloading full history.")
+                store.invalidate(readjusted)
+                store.upsert(self._download_price_panel(readjusted, start=start.isoformat(), end=end.isoformat()), start, today)
+
+            store.prune(start - timedelta(days=Settings.PRICE_STORE_OVERLAP_DAYS))
+            return store.load_panel(tickers, start)
+        except Exception as e:
+            logger.warning(f"Price store unavailable ({e}), downloading full history.")
+            return self._download_price_panel(tickers, period="1y")
+        finally:
+            store.close()
+
+    @staticmethod
+    def summarize_prices(panel):
+        """
+        Computes last price, 1D and 12M variation for every column at once.
+        Each ticker uses its own valid observations (NaN gaps from other
+        markets' calendars are skipped), matching the per-ticker history logic.
+        """
+        if panel.empty:
+            return pd.DataFrame(columns=['price', 'change_1d', 'change_12m', 'observations'])
+
+        values = panel.to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        # Stable sort pushes NaNs to the top, keeping valid closes in chronological order at the bottom
+        order = np.argsort(valid, axis=0, kind='stable')
+        packed = np.take_along_axis(values, order, axis=0)
+        observations = valid.sum(axis=0)
+        rows = len(packed)
+
+        last = packed[-1]
+        prev = packed[-2] if rows >= 2 else np.full(packed.shape[1], np.nan)
+        first = packed[np.clip(rows - observations, 0, rows - 1), np.arange(packed.shape[1])]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change_1d = np.where(observations >= 2, (last - prev) / prev * 100, 0.0)
+            change_12m = np.where(observations >= 1, (last - first) / first * 100, 0.0)
+
+        return pd.DataFrame({
+            'price': np.where(observations >= 1, last, np.nan),
+            'change_1d': change_1d,
+            'change_12m': change_12m,
+            'observations': observations
+        }, index=panel.columns)
+
+    @staticmethod
+    def _default_fundamentals(ticker):
+        return {
+            "dy_12m": 0, "p_vp": 0, "pe": 0, "roe": 0,
+            "sector": "Unknown", "recommendation": "None", "name": ticker
+        }
+
+    @staticmethod
+    def _fetch_ticker_fundamentals(ticker):
+        """Reads `stock.info` for one ticker and normalizes the fields we use."""
+        info = outbound.call("yahoo", lambda: yf.Ticker(ticker).info)
+
+        # Dividend Yield
+        dy = info.get('dividendYield', 0)
+        if dy is None: dy = 0
+        dy = dy * 100 # Convert to percentage
+
+        # Price to Book
+        p_vp = info.get('priceToBook', 0)
+        if p_vp is None: p_vp = 0
+
+        # P/E Ratio
+        pe = info.get('trailingPE', 0)
+        if pe is None: pe = 0
+
+        # ROE
+        roe = info.get('returnOnEquity', 0)
+        if roe is None: roe = 0
+        roe = roe * 100
+
+        # Sector & Recommendation
+        sector = info.get('sector', 'Unknown')
+        recommendation = info.get('recommendationKey', 'None')
+
+        name = info.get('shortName', ticker)
+
+        return {
+            "dy_12m": dy, "p_vp": p_vp, "pe": pe, "roe": roe,
+            "sector": sector, "recommendation": recommendation, "name": name
+        }
+
+    def _fetch_fundamentals(self, tickers):
+        """
+        Fetches fundamentals for all tickers on a bounded thread pool.
+        Each ticker has its own deadline (counted from when its request starts)
+        and the whole stage has a global time budget. Tickers still fresh in
+        the FundamentalsCache are not requested at all. Tickers that fail or
+        miss a deadline fall back to their last cached values, or to the
+        zero/"Unknown" defaults when nothing was cached.
+
+        Abandoned requests are not interrupted: their worker threads run
+        until yfinance's own HTTP timeout and, being non-daemon pool threads,
+        can hold interpreter exit at the end of a one-shot run until then.
+        """
+        fundamentals = {ticker: self._default_fundamentals(ticker) for ticker in tickers}
+        expired = {}
+        had_cache = set()
+
+        cache = FundamentalsCache() if Settings.FUNDAMENTALS_CACHE_ENABLED else None
+        if cache:
+            stale = []
+            for ticker in tickers:
+                cached = cache.get(ticker)
+                if cached is None:
+                    stale.append(ticker)
+                    expired[ticker] = cache.expired_groups(ticker)
+                    previous = cache.peek(ticker)
+                    if previous:
+                        fundamentals[ticker] = previous
+                        had_cache.add(ticker)
+                else:
+                    fundamentals[ticker] = cached
+            logger.info(f"Fundamentals cache: {len(tickers) - len(stale)} hits, {len(stale)} to fetch.")
+            metrics.incr("cache.fundamentals.hit", len(tickers) - len(stale))
+            metrics.incr("cache.fundamentals.miss", len(stale))
+            tickers = stale
+
+        if not tickers:
+            if cache:
+                cache.save()
+            return fundamentals
+
+        ticker_timeout = Settings.FUNDAMENTALS_TICKER_TIMEOUT
+        stage_deadline = time.monotonic() + Settings.FUNDAMENTALS_STAGE_BUDGET
+        started_at = {}
+
+        def task(ticker):
+            started_at[ticker] = time.monotonic()
+            try:
+                return self._fetch_ticker_fundamentals(ticker)
+            finally:
+                metrics.observe("fundamentals.latency_ms", ticker, (time.monotonic() - started_at[ticker]) * 1000)
+
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, Settings.FUNDAMENTALS_WORKERS),
+            thread_name_prefix="fundamentals"
+        )
+        pending = {executor.submit(task, ticker): ticker for ticker in tickers}
+        timed_out = []
+
+        try:
+            while pending:
+                now = time.monotonic()
+                if now >= stage_deadline:
+                    timed_out.extend(pending.values())
+                    break
+
+                # Abandon requests that are running past their own deadline
+                for future, ticker in list(pending.items()):
+                    start = started_at.get(ticker)
+                    if start is not None and now - start >= ticker_timeout:
+                        timed_out.append(ticker)
+                        del pending[future]
+                if not pending:
+                    break
+
+                done, _ = wait(pending, timeout=min(0.25, stage_deadline - now), return_when=FIRST_COMPLETED)
+                for future in done:
+                    ticker = pending.pop(future)
+                    try:
+                        fetched = future.result()
+                        if fetched == self._default_fundamentals(ticker):
+                            # An empty `.info` carries nothing worth caching (or overwriting cached values with)
+                            logger.warning(f"No fundamentals returned for {ticker}.")
+                        elif cache:
+                            fundamentals[ticker] = cache.put(ticker, fetched, groups=expired.get(ticker))
+                        else:
+                            fundamentals[ticker] = fetched
+                    except Exception as e:
+                        logger.warning(f"Could not fetch info for {ticker}: {e}")
+        finally:
+            # Do not wait for stragglers here; their results are simply discarded
+            executor.shutdown(wait=False, cancel_futures=True)
+            if cache:
+                cache.save()
+
+        if timed_out:
+            metrics.incr("fundamentals.timeouts", len(timed_out))
+            stale = sorted(t for t in timed_out if t in had_cache)
+            defaults = sorted(t for t in timed_out if t not in had_cache)
+            if stale:
+                logger.warning(f"Fundamentals timed out for {len(stale)} tickers, using cached values: {stale}")
+            if defaults:
+                logger.warning(f"Fundamentals timed out for {len(defaults)} tickers, using defaults: {defaults}")
+
+        return fundamentals
+
     def get_market_data(self):
         """Fetches prices, variations, and fundamentals for all assets."""
         logger.info("Fetching market data for tickers: %s", self.tickers)
-        results = {}
+        results = MarketData()
 
         indicators = self.get_economic_indicators()
         cdi_diario = (indicators.get('cdi', 0.11) / 100) / 252
+
+        market_tickers = self.quoted_tickers()
+        # The risk benchmark rides along in the same download (prices only, no fundamentals)
+        panel_tickers = list(market_tickers)
+        if market_tickers and Settings.RISK_BENCHMARK and Settings.RISK_BENCHMARK not in market_tickers:
+            panel_tickers.append(Settings.RISK_BENCHMARK)
+        results.history = self._fetch_price_panel(panel_tickers)
+        prices = self.summarize_prices(results.history)
+        fundamentals = self._fetch_fundamentals(market_tickers)
         
         for ticker in self.tickers:
             # Mock Logic for Renda Fixa
-            if ticker == "RDB-NUBANK" or ticker.startswith("RDB"):
+            if self._is_fixed_income(ticker):
                 results[ticker] = {
                     "price": 1.0, 
                     "change_1d": cdi_diario * 100, 
@@ -52,90 +369,29 @@ class DataCollector:
 
             try:
                 logger.info(f"Processing {ticker}...")
-                # Removed custom session to fix ValueError with yfinance
-                stock = yf.Ticker(ticker)
                 
-                # Get history for price and variation
-                try:
-                    hist = stock.history(period="1y")
-                except Exception as e:
-                    logger.warning(f"Failed to fetch history for {ticker}: {e}")
-                    hist = pd.DataFrame()
-                
-                if not hist.empty:
-                    current_price = hist['Close'].iloc[-1]
-                    
-                    # 1D Variation
-                    if len(hist) >= 2:
-                        prev_close = hist['Close'].iloc[-2]
-                        change_1d = ((current_price - prev_close) / prev_close) * 100
-                    else:
-                        change_1d = 0.0
-                        
-                    # 12M Variation
-                    if len(hist) > 0:
-                        price_12m_ago = hist['Close'].iloc[0]
-                        change_12m = ((current_price - price_12m_ago) / price_12m_ago) * 100
-                    else:
-                        change_12m = 0.0
+                if ticker in prices.index and prices.at[ticker, 'observations'] > 0:
+                    current_price = float(prices.at[ticker, 'price'])
+                    change_1d = float(prices.at[ticker, 'change_1d'])
+                    change_12m = float(prices.at[ticker, 'change_12m'])
                 else:
                     # Fallback: Try fast_info if history fails
                     logger.info(f"History empty for {ticker}, trying fast_info...")
-                    current_price = stock.fast_info.get('last_price', 0.0)
+                    # Remembers the last good quote, so a failure in a long-running process is not a zero
+                    current_price = outbound.call(
+                        "yahoo", lambda: yf.Ticker(ticker).fast_info.get('last_price', 0.0), cache_key=("last_price", ticker)
+                    )
                     change_1d = 0.0
                     change_12m = 0.0
 
                 if ticker == "BRL=X":
                     logger.info(f"💵 Cotação Dólar (BRL=X): R$ {current_price:.4f}")
 
-                # Fundamentals
-                try:
-                    info = stock.info
-                    
-                    # Dividend Yield
-                    dy = info.get('dividendYield', 0)
-                    if dy is None: dy = 0
-                    dy = dy * 100 # Convert to percentage
-                    
-                    # Price to Book
-                    p_vp = info.get('priceToBook', 0)
-                    if p_vp is None: p_vp = 0
-                    
-                    # P/E Ratio
-                    pe = info.get('trailingPE', 0)
-                    if pe is None: pe = 0
-                    
-                    # ROE
-                    roe = info.get('returnOnEquity', 0)
-                    if roe is None: roe = 0
-                    roe = roe * 100
-                    
-                    # Sector & Recommendation
-                    sector = info.get('sector', 'Unknown')
-                    recommendation = info.get('recommendationKey', 'None')
-                    
-                    name = info.get('shortName', ticker)
-                except Exception as e:
-                    logger.warning(f"Could not fetch info for {ticker}: {e}")
-                    dy = 0
-                    p_vp = 0
-                    pe = 0
-                    roe = 0
-                    sector = "Unknown"
-                    recommendation = "None"
-                    name = ticker
-
                 results[ticker] = {
                     "price": current_price,
                     "change_1d": change_1d,
                     "change_12m": change_12m,
-                    "dy_12m": dy,
-                    "p_vp": p_vp,
-                    "pe": pe,
-                    "roe": roe,
-                    "sector": sector,
-                    "recommendation": recommendation,
-                    "name": name
+                    **fundamentals[ticker]
                 }
                 
             except Exception as e:
@@ -146,45 +402,62 @@ class DataCollector:
                     "sector": "Unknown", "recommendation": "None", "name": ticker
                 }
 
+        self._fill_stored_prices(results)
         return results
 
-    def get_economic_indicators(self):
-        """Fetches Selic, CDI, and PTAX using python-bcb."""
-        indicators = {}
-        
+    @staticmethod
+    def _fill_stored_prices(results):
+        """Quotes that still failed take the last close in the price store rather than 0."""
+        missing = [t for t, data in results.items() if not data.get('price', 0) > 0]
+        if not missing or not Settings.PRICE_STORE_ENABLED:
+            return
         try:
-            # Selic Meta (432)
-            selic_series = sgs.get({'selic': 432}, last=1)
-            indicators['selic_meta'] = float(selic_series['selic'].iloc[-1])
+            store = PriceStore()
+            try:
+                closes = store.last_closes(missing)
+            finally:
+                store.close()
         except Exception as e:
-            logger.error(f"Error fetching Selic via BCB: {e}")
-            indicators['selic_meta'] = 0.0
+            logger.warning(f"Price store unavailable for the price fallback: {e}")
+            return
+        for ticker, close in closes.items():
+            logger.warning(f"No quote for {ticker}: using the last stored close ({close:.4f}).")
+            results[ticker]['price'] = float(close)
+        metrics.incr("prices.stored_fallbacks", len(closes))
 
-        try:
-            # CDI (12) - Taxa DI % a.a.
-            # Using Selic as proxy for CDI if we can't find the exact annualized CDI series easily, 
-            # but usually CDI follows Selic Over.
-            indicators['cdi'] = indicators['selic_meta'] - 0.10
-        except Exception:
-            indicators['cdi'] = 0.0
+    # Public helpers for callers outside the daily pipeline (src/watch.py, src/backtest.py)
 
-        try:
-            # PTAX (USD)
-            from datetime import timedelta # Certifique-se de importar timedelta no topo ou aqui
-            
-            today = datetime.now()
-            start_date = (today - timedelta(days=5)).strftime('%Y-%m-%d')
-            end_date = today.strftime('%Y-%m-%d')
-            
-            # Pega o intervalo dos últimos 5 dias para garantir que pegue o último dia útil
-            ptax = currency.get('USD', start=start_date, end=end_date)
-            
-            if not ptax.empty:
-                indicators['ptax_venda'] = ptax['USD'].iloc[-1]
-            else:
-                indicators['ptax_venda'] = 0.0
-        except Exception as e:
-            logger.error(f"Error fetching PTAX via BCB: {e}")
-            indicators['ptax_venda'] = 0.0
+    def quoted_tickers(self):
+        """The distinct tickers that have market quotes (everything but fixed income)."""
+        # The same asset may appear on several sheet rows (e.g. held at two brokers)
+        return list(dict.fromkeys(t for t in self.tickers if not self._is_fixed_income(t)))
 
-        return indicators
+    def refresh_prices(self, tickers, period="5d"):
+        """
+        Downloads the last `period` of daily closes for `tickers` straight from
+        Yahoo (no price store). Tickers without any close are dropped.
+        """
+        panel = self._download_price_panel(tickers, period=period)
+        return panel.dropna(axis=1, how='all') if not panel.empty else panel
+
+    def download_prices(self, tickers, start, end):
+        """
+        Daily closes for `tickers` from `start` to `end` (ISO dates, `end`
+        exclusive) straight from Yahoo, one column per ticker.
+        """
+        return self._download_price_panel(tickers, start=start, end=end)
+
+    def fetch_fundamentals(self, tickers):
+        """
+        Fundamentals for `tickers` (through the FundamentalsCache). Tickers
+        with nothing fetched or cached are left out rather than returned
+        with the zero/"Unknown" defaults.
+        """
+        return {
+            ticker: fundamentals for ticker, fundamentals in self._fetch_fundamentals(tickers).items()
+            if fundamentals != self._default_fundamentals(ticker)
+        }
+
+    def get_economic_indicators(self):
+        """Fetches Selic, CDI, and PTAX using python-bcb (shared, cached provider)."""
+        return IndicatorsProvider().get()
@@ -0,0 +1,130 @@
+import json
+import os
+import sys
+import logging
+from datetime import datetime, timedelta
+from config.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+# stock.info fields grouped by how often they actually change
+FIELD_GROUPS = {
+    "valuation": ["dy_12m", "p_vp", "pe", "roe"],
+    "rating": ["recommendation"],
+    "profile": ["sector", "name"],
+}
+
+class FundamentalsCache:
+    """
+    Disk-backed cache of the fundamentals read from `stock.info`.
+    Each field group has its own TTL (Settings.FUNDAMENTALS_TTL_DAYS); a ticker
+    is only refetched when one of its groups expired, and only the expired
+    groups take the new values and a new timestamp, so a slow-changing group
+    keeps its cached fields (and age) across the refreshes of a faster one.
+    The file is capped at FUNDAMENTALS_CACHE_MAX_ENTRIES tickers, evicting
+    the least recently used.
+    """
+
+    def __init__(self, path=None, ttl_days=None, max_entries=None):
+        self.path = path or Settings.FUNDAMENTALS_CACHE_PATH
+        self.ttl_days = ttl_days or Settings.FUNDAMENTALS_TTL_DAYS
+        self.max_entries = max_entries or Settings.FUNDAMENTALS_CACHE_MAX_ENTRIES
+        self.entries = self._load()
+
+    def _load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.warning(f"Failed to load fundamentals cache, starting empty: {e}")
+        return {}
+
+    def expired_groups(self, ticker, now=None):
+        """Field groups of `ticker` that are missing or past their TTL (all of them when not cached)."""
+        entry = self.entries.get(ticker)
+        if not entry:
+            return list(FIELD_GROUPS)
+
+        now = now or datetime.now()
+        expired = []
+        for group in FIELD_GROUPS:
+            fetched_at = entry.get("fetched_at", {}).get(group)
+            ttl = timedelta(days=self.ttl_days.get(group, 0))
+            if not fetched_at or now - datetime.fromisoformat(fetched_at) >= ttl:
+                expired.append(group)
+        return expired
+
+    def get(self, ticker, now=None):
+        """Returns the cached fundamentals if every field group is still fresh, else None."""
+        if self.expired_groups(ticker, now):
+            return None
+
+        entry = self.entries[ticker]
+        entry["last_used"] = (now or datetime.now()).isoformat(timespec='seconds')
+        return dict(entry["fields"])
+
+    def peek(self, ticker):
+        """Returns the cached fundamentals regardless of age (used as a fallback), or None."""
+        entry = self.entries.get(ticker)
+        return dict(entry["fields"]) if entry else None
+
+    def put(self, ticker, fundamentals, now=None, groups=None):
+        """
+        Stores freshly fetched fundamentals. With `groups` only the fields of
+        those groups are replaced and re-stamped; the others keep their cached
+        values and timestamps. Returns the merged fields.
+        """
+        stamp = (now or datetime.now()).isoformat(timespec='seconds')
+        entry = self.entries.get(ticker)
+        if entry is None or groups is None:
+            entry = self.entries[ticker] = {"fields": {}, "fetched_at": {}}
+            groups = list(FIELD_GROUPS)
+
+        grouped = {field for group in FIELD_GROUPS.values() for field in group}
+        for group in groups:
+            for field in FIELD_GROUPS[group]:
+                if field in fundamentals:
+                    entry["fields"][field] = fundamentals[field]
+            entry["fetched_at"][group] = stamp
+        # Fields outside every group are always refreshed
+        entry["fields"].update({k: v for k, v in fundamentals.items() if k not in grouped})
+        entry["last_used"] = stamp
+        return dict(entry["fields"])
+
+    def invalidate(self, tickers=None, groups=None):
+        """
+        Expires cached data. With no tickers every entry is affected; with no
+        groups the whole entry is dropped instead of just the group stamps.
+        """
+        targets = list(self.entries) if tickers is None else [t for t in tickers if t in self.entries]
+        for ticker in targets:
+            if groups is None:
+                del self.entries[ticker]
+            else:
+                for group in groups:
+                    self.entries[ticker].get("fetched_at", {}).pop(group, None)
+        return len(targets)
+
+    def save(self):
+        """Evicts least recently used tickers above the cap and writes the file atomically."""
+        if len(self.entries) > self.max_entries:
+            by_use = sorted(self.entries, key=lambda t: self.entries[t].get("last_used", ""))
+            for ticker in by_use[:len(self.entries) - self.max_entries]:
+                del self.entries[ticker]
+
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Failed to save fundamentals cache: {e}")
+
+if __name__ == "__main__":
+    # python -m src.fundamentals_cache [TICKER ...]  -> invalida o cache (tudo se nenhum ticker for passado)
+    cache = FundamentalsCache()
+    removed = cache.invalidate(sys.argv[1:] or None)
+    cache.save()
+    print(f"{removed} ticker(s) removidos do cache de fundamentos.")
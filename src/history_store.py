@@ -0,0 +1,108 @@
+import json
+import os
+import bisect
+import logging
+from config.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+class HistoryStore:
+    """
+    Daily valuation history kept as an append-only JSON Lines log
+    (data/history.jsonl), one entry per line:
+
+        {"date": "2025-12-01", "value": 5253.08, "positions": {"BBAS3.SA": 912.5, ...}}
+
+    Days saved while some tickers had no quote list them under "missing".
+
+    Upserting a date appends a single line (the last line for a date wins),
+    so the daily commit of this file is a one-line diff. An in-memory index
+    gives O(1) lookups by date and O(log n) "last entry before date".
+    Superseded lines are compacted away once they pile up.
+    """
+
+    def __init__(self, path=None, legacy_path=None):
+        self.path = path or Settings.HISTORY_PATH
+        # Only the default log inherits the old single-portfolio file; batch portfolios start empty
+        if legacy_path is None and os.path.abspath(self.path) == os.path.abspath(Settings.HISTORY_PATH):
+            legacy_path = Settings.HISTORY_LEGACY_PATH
+        self.legacy_path = legacy_path
+        self.entries = {}
+        self.dates = []
+        self.superseded = 0
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if self.legacy_path and not os.path.exists(self.path) and os.path.exists(self.legacy_path):
+            self._migrate_legacy()
+        self._load()
+
+    def _migrate_legacy(self):
+        """One-time conversion of the old data/history.json list into the log format."""
+        try:
+            with open(self.legacy_path, 'r') as f:
+                legacy = json.load(f)
+            by_date = {entry['date']: entry for entry in legacy}
+            self._write_all([by_date[date] for date in sorted(by_date)])
+            logger.info(f"Migrated {len(by_date)} entries from {self.legacy_path} to {self.path}.")
+        except Exception as e:
+            logger.error(f"Failed to migrate {self.legacy_path}: {e}")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    entry = json.loads(line)
+                    if entry['date'] in self.entries:
+                        self.superseded += 1
+                    self.entries[entry['date']] = entry
+            self.dates = sorted(self.entries)
+        except Exception as e:
+            logger.error(f"Failed to load {self.path}: {e}")
+
+    def _write_all(self, entries):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def get(self, date):
+        return self.entries.get(date)
+
+    def last_before(self, date):
+        """Returns the most recent entry strictly before `date` (YYYY-MM-DD), or None."""
+        i = bisect.bisect_left(self.dates, date)
+        return self.entries[self.dates[i - 1]] if i > 0 else None
+
+    def upsert(self, date, value, positions=None, missing=None):
+        """Records the portfolio value (and optional per-ticker values and unquoted tickers) for `date`."""
+        entry = {"date": date, "value": value}
+        if positions is not None:
+            entry["positions"] = positions
+        if missing:
+            entry["missing"] = sorted(missing)
+
+        if date in self.entries:
+            self.superseded += 1
+        else:
+            bisect.insort(self.dates, date)
+        self.entries[date] = entry
+
+        try:
+            if self.dates and date < self.dates[-1] or self.superseded >= Settings.HISTORY_COMPACT_THRESHOLD:
+                self.compact()
+            else:
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps(entry) + "\n")
+        except Exception as e:
+            logger.error(f"Failed to save {self.path}: {e}")
+
+    def compact(self):
+        """Rewrites the log sorted by date with a single line per date."""
+        self._write_all([self.entries[date] for date in self.dates])
+        self.superseded = 0
@@ -0,0 +1,46 @@
+import os
+import re
+import subprocess
+import sys
+
+# One line of `python -X importtime`: "import time:  self [us] | cumulative | imported package"
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+def parse_importtime(lines):
+    """Returns [(module, self_us, cumulative_us, depth)] from `-X importtime` output, skipping other lines."""
+    records = []
+    for line in lines:
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            records.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return records
+
+def format_report(records, top=20):
+    """Total import time plus the slowest top-level packages (self time of all their submodules)."""
+    by_package = {}
+    for module, self_us, _, _ in records:
+        package = module.split('.')[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+
+    total_us = sum(by_package.values())
+    lines = [f"Import time: {total_us / 1e6:.3f}s across {len(records)} modules"]
+    for package, self_us in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]:
+        lines.append(f"  {self_us / 1e3:9.1f} ms  {self_us / total_us * 100 if total_us else 0:5.1f}%  {package}")
+    return "\n".join(lines)
+
+def run_profiled(argv, top=20):
+    """
+    Re-runs the script with PYTHONPROFILEIMPORTTIME=1, so every import made
+    during the run (including the lazy ones inside stages) is measured.
+    The child's own stderr output is passed through; the import report is
+    printed once it exits. Returns the child's exit code.
+    """
+    env = dict(os.environ, PYTHONPROFILEIMPORTTIME="1")
+    process = subprocess.run([sys.executable, *argv], env=env, stderr=subprocess.PIPE, text=True)
+
+    other = [line for line in process.stderr.splitlines() if not line.startswith("import time:")]
+    if other:
+        print("\n".join(other), file=sys.stderr)
+    print(format_report(parse_importtime(process.stderr.splitlines()), top))
+    return process.returncode
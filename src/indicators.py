@@ -0,0 +1,129 @@
+import json
+import os
+import logging
+import threading
+from datetime import datetime, timedelta
+from bcb import sgs, currency
+from config.settings import Settings
+from src.metrics import metrics
+from src.outbound import outbound
+
+logger = logging.getLogger(__name__)
+
+class IndicatorsProvider:
+    """
+    Shared source of the BCB indicators (Selic, CDI, PTAX).
+    All SGS series are requested in a single `sgs.get` call. Complete
+    results are memoized in the process and persisted to disk for the rest
+    of the business day; a partial fetch (some values from the fallback) is
+    retried by the next caller. A lock makes concurrent callers wait for the
+    fetch already in flight instead of issuing their own.
+    """
+
+    _lock = threading.Lock()
+    _memo = None  # (business_day, indicators)
+
+    def __init__(self, cache_path=None):
+        self.cache_path = cache_path or Settings.INDICATORS_CACHE_PATH
+
+    @staticmethod
+    def _business_day(moment):
+        # Weekends map back to Friday: BCB publishes nothing new until Monday
+        day = moment.date()
+        while day.weekday() >= 5:
+            day -= timedelta(days=1)
+        return day
+
+    def get(self):
+        """Returns {'selic_meta', 'cdi', 'ptax_venda'} fetching from the BCB at most once per business day."""
+        with self._lock:
+            today = self._business_day(datetime.now())
+            memo = IndicatorsProvider._memo
+            if memo is not None and memo[0] == today:
+                return dict(memo[1])
+
+            cached = self._load_cache()
+            if cached and cached.get("business_day") == today.isoformat():
+                logger.info("Indicadores econômicos carregados do cache local.")
+                metrics.incr("cache.indicators.hit")
+                IndicatorsProvider._memo = (today, cached["indicators"])
+                return dict(cached["indicators"])
+
+            metrics.incr("cache.indicators.miss")
+            indicators, complete = self._fetch(cached.get("indicators", {}) if cached else {})
+            if complete:
+                IndicatorsProvider._memo = (today, indicators)
+                self._save_cache(today, indicators)
+            return dict(indicators)
+
+    @classmethod
+    def reset(cls):
+        """Drops the in-process memo (the disk cache is kept)."""
+        with cls._lock:
+            cls._memo = None
+
+    def _fetch(self, previous):
+        """
+        Fetches every indicator. Failed values fall back to the last cached
+        ones when available; `complete` tells whether everything came fresh.
+        """
+        indicators = {}
+        complete = True
+
+        try:
+            with metrics.span("bcb.sgs", series=len(Settings.SGS_SERIES)):
+                series = outbound.call("bcb", sgs.get, Settings.SGS_SERIES, last=1)
+            for name in Settings.SGS_SERIES:
+                indicators[name] = float(series[name].dropna().iloc[-1])
+        except Exception as e:
+            logger.error(f"Error fetching SGS series via BCB: {e}")
+            complete = False
+
+        if 'selic_meta' not in indicators:
+            indicators['selic_meta'] = previous.get('selic_meta', 0.0)
+        if 'cdi' not in indicators:
+            # Selic Over runs ~0.10 p.p. below the target; use it as a CDI proxy
+            indicators['cdi'] = previous.get('cdi', indicators['selic_meta'] - 0.10 if indicators['selic_meta'] else 0.0)
+
+        try:
+            # PTAX (USD)
+            today = datetime.now()
+            start_date = (today - timedelta(days=5)).strftime('%Y-%m-%d')
+            end_date = today.strftime('%Y-%m-%d')
+
+            # Pega o intervalo dos últimos 5 dias para garantir que pegue o último dia útil
+            with metrics.span("bcb.ptax"):
+                ptax = outbound.call("bcb", currency.get, 'USD', start=start_date, end=end_date)
+
+            if not ptax.empty:
+                indicators['ptax_venda'] = float(ptax['USD'].iloc[-1])
+            else:
+                indicators['ptax_venda'] = previous.get('ptax_venda', 0.0)
+                complete = False
+        except Exception as e:
+            logger.error(f"Error fetching PTAX via BCB: {e}")
+            indicators['ptax_venda'] = previous.get('ptax_venda', 0.0)
+            complete = False
+
+        return indicators, complete
+
+    def _load_cache(self):
+        try:
+            if os.path.exists(self.cache_path):
+                with open(self.cache_path, 'r') as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.warning(f"Failed to load indicators cache: {e}")
+        return None
+
+    def _save_cache(self, business_day, indicators):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+            with open(self.cache_path, 'w') as f:
+                json.dump({
+                    "business_day": business_day.isoformat(),
+                    "fetched_at": datetime.now().isoformat(timespec='seconds'),
+                    "indicators": indicators
+                }, f, indent=2)
+        except Exception as e:
+            logger.error(f"Failed to save indicators cache: {e}")
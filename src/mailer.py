@@ -0,0 +1,111 @@
+import smtplib
+import socket
+import time
+import logging
+import threading
+from config.settings import Settings
+from src.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Errors worth another attempt: dropped connections, timeouts and 4xx replies
+TRANSIENT_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, socket.timeout)
+
+class SMTPMailer:
+    """
+    Delivery layer over one authenticated SMTP connection.
+
+    The connection is opened on the first message and reused for the
+    following ones (a NOOP checks it after SMTP_IDLE_CHECK_SECONDS idle),
+    and recycled after SMTP_MAX_MESSAGES_PER_CONNECTION messages to stay
+    under provider limits. Transient failures (disconnects, timeouts, 4xx
+    replies) reconnect and retry with exponential backoff; permanent 5xx
+    replies fail immediately. Call `close()` when the batch is done.
+    """
+
+    def __init__(self, host=None, port=None, starttls=None, username=None, password=None):
+        self.host = host or Settings.SMTP_HOST
+        self.port = port or Settings.SMTP_PORT
+        self.starttls = Settings.SMTP_STARTTLS if starttls is None else starttls
+        self.username = username or Settings.EMAIL_SENDER
+        self.password = password or Settings.EMAIL_PASSWORD
+        self._server = None
+        self._sent_on_connection = 0
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        with metrics.span("smtp.connect"):
+            server = smtplib.SMTP(self.host, self.port, timeout=Settings.SMTP_TIMEOUT_SECONDS)
+            try:
+                if self.starttls:
+                    server.starttls()
+                server.login(self.username, self.password)
+            except Exception:
+                server.close()
+                raise
+        self._server = server
+        self._sent_on_connection = 0
+        metrics.incr("smtp.connections")
+
+    def _disconnect(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            try:
+                self._server.close()
+            except Exception:
+                pass
+        self._server = None
+
+    def _ensure_connection(self):
+        if self._server is not None and self._sent_on_connection >= Settings.SMTP_MAX_MESSAGES_PER_CONNECTION:
+            self._disconnect()
+        elif self._server is not None and time.monotonic() - self._last_used > Settings.SMTP_IDLE_CHECK_SECONDS:
+            try:
+                alive = self._server.noop()[0] == 250
+            except Exception:
+                alive = False
+            if not alive:
+                self._disconnect()
+        if self._server is None:
+            self._connect()
+
+    @staticmethod
+    def _is_transient(error):
+        if isinstance(error, smtplib.SMTPResponseException):
+            return 400 <= error.smtp_code < 500
+        return isinstance(error, TRANSIENT_ERRORS)
+
+    def send(self, msg, recipients):
+        """Sends `msg` to `recipients` (envelope), retrying transient errors on a fresh connection."""
+        attempts = Settings.SMTP_RETRIES + 1
+        with self._lock:
+            for attempt in range(1, attempts + 1):
+                try:
+                    self._ensure_connection()
+                    with metrics.span("smtp.send", recipients=len(recipients)):
+                        self._server.send_message(msg, to_addrs=recipients)
+                    self._sent_on_connection += 1
+                    self._last_used = time.monotonic()
+                    return
+                except Exception as e:
+                    if not self._is_transient(e):
+                        # smtplib already RSETs after a refused transaction; anything else may leave the session dirty
+                        if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                            self._disconnect()
+                        raise
+                    # The next attempt (or message) starts from a fresh session
+                    self._disconnect()
+                    if attempt == attempts:
+                        raise
+                    delay = Settings.SMTP_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)
+                    logger.warning(f"Transient SMTP error ({e}); retrying in {delay:.1f}s ({attempt}/{attempts - 1}).")
+                    metrics.incr("smtp.retries")
+                    time.sleep(delay)
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
@@ -0,0 +1,133 @@
+import json
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from config.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+class RunMetrics:
+    """
+    Lightweight, thread-safe instrumentation for one run of the job.
+
+        with metrics.span("stage.market"): ...             # duration of a block
+        metrics.observe("fundamentals.latency_ms", "PETR4.SA", 812.4)
+        metrics.incr("cache.fundamentals.hit")             # counters (retries, hits...)
+
+    `write()` dumps everything as JSON (stage durations, per-key latencies,
+    counters and the derived cache hit rates). A stage that runs several
+    times (once per portfolio in a batch) reports the sum of its durations;
+    the individual runs stay in `spans`. With METRICS_ENABLED=false
+    every call returns immediately, so the instrumentation can stay in place.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.now()
+            self._t0 = time.perf_counter()
+            self.spans = []
+            self.observations = {}
+            self.counters = {}
+
+    @contextmanager
+    def _span(self, name, attrs):
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            record = {
+                "name": name,
+                "start_ms": round((start - self._t0) * 1000, 3),
+                "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+                "thread": threading.current_thread().name
+            }
+            if attrs:
+                record["attrs"] = attrs
+            if error:
+                record["error"] = error
+            with self._lock:
+                self.spans.append(record)
+
+    def span(self, name, **attrs):
+        """Context manager timing the enclosed block."""
+        if not self.enabled:
+            return nullcontext()
+        return self._span(name, attrs)
+
+    def observe(self, series, key, value):
+        """Records one value (e.g. a latency in ms) for `key` within `series`."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.observations.setdefault(series, {})[key] = round(value, 3)
+
+    def incr(self, counter, amount=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def counter_group(self, prefix):
+        """Counters whose name starts with `prefix`, with the prefix removed."""
+        with self._lock:
+            return {name[len(prefix):]: count for name, count in self.counters.items() if name.startswith(prefix)}
+
+    def cache_hit_rates(self):
+        """Derives hit rates from `cache.<name>.hit` / `cache.<name>.miss` counters."""
+        rates = {}
+        names = {key.split(".")[1] for key in self.counters if key.startswith("cache.")}
+        for name in names:
+            hits = self.counters.get(f"cache.{name}.hit", 0)
+            misses = self.counters.get(f"cache.{name}.miss", 0)
+            if hits + misses:
+                rates[name] = round(hits / (hits + misses), 4)
+        return rates
+
+    def summary(self):
+        with self._lock:
+            # Summed: a batch run executes the report stages once per portfolio
+            stages = {}
+            for span in self.spans:
+                if span["name"].startswith("stage."):
+                    name = span["name"][len("stage."):]
+                    stages[name] = round(stages.get(name, 0.0) + span["duration_ms"], 3)
+            return {
+                "started_at": self.started_at.isoformat(timespec='seconds'),
+                "total_ms": round((time.perf_counter() - self._t0) * 1000, 3),
+                "stages_ms": stages,
+                "counters": dict(self.counters),
+                "cache_hit_rates": self.cache_hit_rates(),
+                "observations": {series: dict(values) for series, values in self.observations.items()},
+                "spans": list(self.spans)
+            }
+
+    def write(self, directory=None):
+        """Writes the run report to <METRICS_DIR>/run-YYYYmmdd-HHMMSS.json and returns its path."""
+        if not self.enabled:
+            return None
+        directory = directory or Settings.METRICS_DIR
+        try:
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"run-{self.started_at.strftime('%Y%m%d-%H%M%S')}.json")
+            with open(path, 'w') as f:
+                json.dump(self.summary(), f, indent=2, default=str)
+            logger.info(f"Run metrics written to {path}")
+            return path
+        except Exception as e:
+            logger.error(f"Failed to write run metrics: {e}")
+            return None
+
+# Process-wide instance used by every collector
+metrics = RunMetrics(enabled=Settings.METRICS_ENABLED)
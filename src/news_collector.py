@@ -1,6 +1,8 @@
 from GoogleNews import GoogleNews
 import logging
 from datetime import datetime
+from src.metrics import metrics
+from src.outbound import outbound
 
 logger = logging.getLogger(__name__)
 
@@ -8,6 +10,15 @@ class NewsCollector:
     def __init__(self):
         self.googlenews = GoogleNews(lang='pt', region='BR')
         
+    def _search(self, query):
+        self.googlenews.clear()
+        self.googlenews.search(query)
+        results = self.googlenews.result()
+        if not results:
+            # GoogleNews swallows HTTP errors (e.g. 429) and just returns nothing
+            raise ConnectionError("empty Google News result")
+        return results
+
     def get_top_news(self):
         """
         Busca as top 5 notícias sobre 'Mercado Financeiro' e 'Ibovespa'.
@@ -15,11 +26,9 @@ class NewsCollector:
         """
         try:
             logger.info("Buscando notícias do mercado financeiro...")
-            self.googlenews.clear()
-            
-            # Busca combinada para ter um contexto geral
-            self.googlenews.search('Mercado Financeiro Ibovespa')
-            results = self.googlenews.result()
+            # Busca combinada para ter um contexto geral (sem resposta, usa a última busca que funcionou)
+            with metrics.span("news.search"):
+                results = outbound.call("googlenews", self._search, 'Mercado Financeiro Ibovespa', cache_key="top_news")
             
             # Filtra e formata
             top_news = []
@@ -1,56 +1,106 @@
-import smtplib
+import base64
 from email.mime.text import MIMEText
+from email.mime.image import MIMEImage
 from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
+from email.utils import formatdate, make_msgid
 from config.settings import Settings
+from src.mailer import SMTPMailer
 import logging
 import os
+import math
+import functools
 import markdown
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
 
 logger = logging.getLogger(__name__)
 
+CHART_CID = "allocation-chart"
+EMAIL_TEMPLATE = 'email_template.html'
+
+@functools.lru_cache(maxsize=None)
+def get_template(template_dir, name):
+    """
+    Compiled template shared by the whole process. The environment never
+    re-checks the file (auto_reload off) and keeps the compiled bytecode on
+    disk, so new processes skip the Jinja parse/compile step as well.
+    """
+    os.makedirs(Settings.TEMPLATE_CACHE_DIR, exist_ok=True)
+    env = Environment(
+        loader=FileSystemLoader(template_dir),
+        bytecode_cache=FileSystemBytecodeCache(Settings.TEMPLATE_CACHE_DIR),
+        auto_reload=False
+    )
+    return env.get_template(name)
+
+def format_number(value, spec):
+    """format(value, spec), with "—" for NaN/inf (e.g. a beta without benchmark history)."""
+    if isinstance(value, float) and not math.isfinite(value):
+        return "—"
+    return format(value, spec)
+
+def format_rows(df, formats):
+    """
+    DataFrame -> list of dicts for the template. `formats` maps each column
+    to a format spec ('' keeps the raw value); every spec is applied to a
+    whole column at once instead of row by row.
+    """
+    columns = {
+        column: [format_number(value, spec) for value in df[column].to_numpy()] if spec else df[column].tolist()
+        for column, spec in formats.items()
+    }
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
 class Notifier:
-    def __init__(self):
+    def __init__(self, mailer=None):
         self.template_dir = 'templates'
         os.makedirs(self.template_dir, exist_ok=True)
-        self.env = Environment(loader=FileSystemLoader(self.template_dir))
+        # One pooled SMTP connection shared by every e-mail sent through this notifier
+        self.mailer = mailer or SMTPMailer()
 
-    def send_email(self, subject, context):
+    def close(self):
+        self.mailer.close()
+
+    def send_email(self, subject, context, recipients=None):
+        """
+        Renders the report once and sends one message per recipient over the
+        pooled connection. The chart travels as a multipart/related CID
+        image instead of a data: URI. Raises if any recipient failed.
+        """
         if not Settings.EMAIL_SENDER or not Settings.EMAIL_PASSWORD:
             logger.warning("Email credentials not set. Skipping email.")
             return
 
-        msg = MIMEMultipart()
-        msg['From'] = Settings.EMAIL_SENDER
-
-        raw_receivers = Settings.EMAIL_RECEIVER
-        recipients_list = [email.strip() for email in raw_receivers.split(',')]
-        msg['To'] = ", ".join(recipients_list)
+        if recipients:
+            recipients_list = list(recipients)
+        else:
+            raw_receivers = Settings.EMAIL_RECEIVER
+            recipients_list = [email.strip() for email in raw_receivers.split(',')]
+        recipients_list = [email for email in recipients_list if email]
 
+        # multipart/related: the HTML body plus the images it references by CID
+        msg = MIMEMultipart('related')
+        msg['From'] = Settings.EMAIL_SENDER
         msg['Subject'] = subject
+        msg['Date'] = formatdate(localtime=True)
 
         try:
-            template = self.env.get_template('email_template.html')
+            template = get_template(self.template_dir, EMAIL_TEMPLATE)
             
             # Format numbers for display
             formatted_context = context.copy()
             formatted_context['total_value'] = f"{context['total_value']:,.2f}"
+            if context.get('contribution_amount') is not None:
+                formatted_context['contribution_amount'] = f"{context['contribution_amount']:,.2f}"
             
             # Convert AI markdown to HTML
             if 'ai_analysis' in formatted_context and formatted_context['ai_analysis']:
                  formatted_context['ai_analysis'] = markdown.markdown(formatted_context['ai_analysis'])
             
             # Format suggestions list
-            suggestions_list = []
-            for _, row in context['suggestions'].iterrows():
-                suggestions_list.append({
-                    'category': row['category'],
-                    'current_pct': f"{row['current_pct']:.1f}",
-                    'target_pct': f"{row['target_pct']:.1f}",
-                    'status': row['status']
-                })
-            formatted_context['suggestions'] = suggestions_list
+            formatted_context['suggestions'] = format_rows(
+                context['suggestions'],
+                {'category': '', 'current_pct': '.1f', 'target_pct': '.1f', 'status': ''}
+            )
             
             # Format contribution
             if isinstance(context['contribution'], str):
@@ -58,30 +108,66 @@ class Notifier:
                 formatted_context['contribution'] = context['contribution']
             else:
                 formatted_context['contribution_is_str'] = False
-                contribution_list = []
-                for _, row in context['contribution'].iterrows():
-                    contribution_list.append({
-                        'category': row['category'],
-                        'contribution': f"{row['contribution']:,.2f}"
-                    })
-                formatted_context['contribution'] = contribution_list
+                formatted_context['contribution'] = format_rows(
+                    context['contribution'], {'category': '', 'contribution': ',.2f'}
+                )
+
+            # Format buy orders (whole shares per ticker)
+            orders = context.get('orders')
+            formatted_context['orders'] = format_rows(
+                orders, {'ticker': '', 'shares': 'g', 'price': ',.2f', 'cost': ',.2f'}
+            ) if orders is not None and not orders.empty else []
+            if context.get('leftover') is not None:
+                formatted_context['leftover'] = f"{context['leftover']:,.2f}"
+
+            # Format risk metrics (portfolio summary + assets that add the most risk)
+            risk = context.get('risk')
+            if risk:
+                formatted_context['risk'] = {
+                    key: format_number(value, ',.2f') if isinstance(value, float) else value
+                    for key, value in risk['portfolio'].items()
+                }
+                formatted_context['risk']['confidence'] = f"{risk['portfolio']['confidence']:.0f}"
+                if not math.isfinite(risk['portfolio']['beta']):
+                    formatted_context['risk']['beta'] = None
+                formatted_context['risk_assets'] = format_rows(
+                    risk['assets'].head(Settings.AI_PROMPT_TOP_K),
+                    {'ticker': '', 'weight': '.1f', 'volatility': '.1f', 'var': '.2f', 'max_drawdown': '.1f', 'beta': '.2f', 'risk_share': '.1f'}
+                )
+
+            chart = context.get('allocation_chart')
+            formatted_context['allocation_chart_cid'] = CHART_CID if chart else None
 
             html_content = template.render(formatted_context)
             msg.attach(MIMEText(html_content, 'html'))
+
+            if chart:
+                subtype = (context.get('allocation_chart_mime') or 'image/png').split('/', 1)[1]
+                image = MIMEImage(base64.b64decode(chart), _subtype=subtype)
+                image.add_header('Content-ID', f"<{CHART_CID}>")
+                image.add_header('Content-Disposition', 'inline', filename=f"alocacao.{subtype.split('+')[0]}")
+                msg.attach(image)
             
         except Exception as e:
             logger.error(f"Error rendering email template: {e}")
             # Fallback to simple text if template fails
             msg.attach(MIMEText("Erro ao gerar relatório HTML. Verifique os logs.", 'plain'))
 
-        try:
-            # Gmail SMTP
-            server = smtplib.SMTP('smtp.gmail.com', 587)
-            server.starttls()
-            server.login(Settings.EMAIL_SENDER, Settings.EMAIL_PASSWORD)
-            server.send_message(msg)
-            server.quit()
-            logger.info(f"Email sent successfully to: {recipients_list}")
-        except Exception as e:
-            logger.error(f"Failed to send email: {e}")
-            raise e
\ No newline at end of file
+        # Same body for everyone; only the To header and envelope change
+        failed = []
+        for recipient in recipients_list:
+            del msg['To']
+            del msg['Message-ID']
+            msg['To'] = recipient
+            msg['Message-ID'] = make_msgid()
+            try:
+                self.mailer.send(msg, [recipient])
+            except Exception as e:
+                logger.error(f"Failed to send email to {recipient}: {e}")
+                failed.append(recipient)
+
+        sent = len(recipients_list) - len(failed)
+        if sent:
+            logger.info(f"Email sent successfully to {sent} of {len(recipients_list)} recipients.")
+        if failed:
+            raise RuntimeError(f"Failed to send email to: {failed}")
\ No newline at end of file
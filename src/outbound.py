@@ -0,0 +1,215 @@
+import time
+import random
+import logging
+import threading
+import urllib.error
+from config.settings import Settings
+from src.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a host whose circuit breaker is open."""
+
+class EmptyResultError(ValueError):
+    """
+    The host answered but had no data for the request. That is usually an
+    unknown ticker or a date range without quotes, but yfinance also
+    reports throttling this way, and the two cannot be told apart. So it
+    is retried OUTBOUND_EMPTY_RETRIES times with backoff and then raised
+    as a non-transient error. The trade-off: a ticker that really has no
+    data costs those retries on every call, and a throttle that outlasts
+    the backoff is reported as missing data. It never counts against the
+    host's circuit breaker, which is shared by every call to the host and
+    would otherwise open over a few bad tickers.
+    """
+
+class TokenBucket:
+    """
+    Token bucket of `rate` requests per second with bursts of `capacity`.
+    `acquire()` reserves a token and sleeps until it is due, outside the
+    lock, so concurrent callers are spaced out instead of serialized.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Takes one token; returns the seconds waited for it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive transient failures; while open every
+    call is rejected. After `reset_seconds` one trial call is let through
+    (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failures, reset_seconds):
+        self.failure_threshold = failures
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_seconds and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def failure(self):
+        """Records a failure; returns True when this one opened the circuit."""
+        with self._lock:
+            self.failures += 1
+            was_open = self.opened_at is not None
+            self.trial_running = False
+            if was_open or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                return not was_open
+            return False
+
+class Outbound:
+    """
+    Single path for calls to external services (Yahoo, BCB, Google News,
+    the sheet). Per host: a token-bucket rate limit (OUTBOUND_RATE_LIMITS),
+    retries of transient errors with exponential backoff and full jitter,
+    and a circuit breaker. Calls made with a `cache_key` remember their
+    last good result, which is returned (with a warning) when the host
+    fails or its breaker is open. Throttle, retry, failure, breaker and
+    fallback counts go to `metrics` as outbound.<host>.<event>.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forgets limiters, breakers and last good values (e.g. after changing settings)."""
+        with self._lock:
+            self._buckets = {}
+            self._breakers = {}
+            self._last_good = {}
+
+    def _bucket(self, host):
+        with self._lock:
+            if host not in self._buckets:
+                limit = Settings.OUTBOUND_RATE_LIMITS.get(host)
+                self._buckets[host] = TokenBucket(*limit) if limit and limit[0] > 0 else None
+            return self._buckets[host]
+
+    def _breaker(self, host):
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(Settings.OUTBOUND_BREAKER_FAILURES, Settings.OUTBOUND_BREAKER_RESET_SECONDS)
+            return self._breakers[host]
+
+    @staticmethod
+    def is_transient(error):
+        """Worth retrying: network errors, timeouts, 408/429 and 5xx. Bad input and other 4xx are not."""
+        status = getattr(error, 'code', None) if isinstance(error, urllib.error.HTTPError) else None
+        response = getattr(error, 'response', None)
+        if status is None and response is not None:
+            status = getattr(response, 'status_code', None)
+        if status is not None:
+            return status in (408, 429) or status >= 500
+        return not isinstance(error, (ValueError, KeyError, TypeError, AttributeError, IndexError))
+
+    @staticmethod
+    def _backoff(attempt):
+        """Exponential backoff with full jitter for the given attempt (1-based)."""
+        return random.uniform(0, min(Settings.OUTBOUND_BACKOFF_MAX_SECONDS,
+                                     Settings.OUTBOUND_BACKOFF_SECONDS * 2 ** (attempt - 1)))
+
+    def _fallback(self, host, cache_key, error):
+        if cache_key is not None and (host, cache_key) in self._last_good:
+            logger.warning(f"{host} unavailable ({error}); using the last good value for {cache_key}.")
+            metrics.incr(f"outbound.{host}.fallbacks")
+            return self._last_good[(host, cache_key)]
+        raise error
+
+    def call(self, host, fn, *args, cache_key=None, **kwargs):
+        """
+        Calls fn(*args, **kwargs) for `host` under its rate limit, retry and
+        breaker policy. Non-transient errors are raised at once and do not
+        count against the breaker.
+        """
+        breaker = self._breaker(host)
+        if not breaker.allow():
+            metrics.incr(f"outbound.{host}.rejected")
+            return self._fallback(host, cache_key, CircuitOpenError(f"circuit open for {host}"))
+
+        bucket = self._bucket(host)
+        retries = empty_retries = 0
+        attempt = 0
+        while True:
+            attempt += 1
+            if bucket and bucket.acquire() > 0:
+                metrics.incr(f"outbound.{host}.throttled")
+            metrics.incr(f"outbound.{host}.calls")
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if isinstance(e, EmptyResultError) and empty_retries < Settings.OUTBOUND_EMPTY_RETRIES:
+                    empty_retries += 1
+                    delay = self._backoff(attempt)
+                    logger.info(f"Empty {host} result ({e}); retrying in {delay:.1f}s in case it was throttled.")
+                    metrics.incr(f"outbound.{host}.empty_retries")
+                    time.sleep(delay)
+                    continue
+                if not self.is_transient(e):
+                    breaker.success()
+                    raise
+                metrics.incr(f"outbound.{host}.failures")
+                if breaker.failure():
+                    logger.warning(f"Circuit breaker opened for {host} after repeated failures.")
+                    metrics.incr(f"outbound.{host}.breaker_opened")
+                if retries == Settings.OUTBOUND_RETRIES or not breaker.allow():
+                    return self._fallback(host, cache_key, e)
+                retries += 1
+                delay = self._backoff(attempt)
+                logger.warning(f"Transient {host} error ({e}); retrying in {delay:.1f}s ({retries}/{Settings.OUTBOUND_RETRIES}).")
+                metrics.incr(f"outbound.{host}.retries")
+                time.sleep(delay)
+                continue
+
+            breaker.success()
+            if cache_key is not None:
+                with self._lock:
+                    self._last_good[(host, cache_key)] = result
+            return result
+
+    @staticmethod
+    def log_summary():
+        """Logs this run's outbound counters per host (retries, throttling, breaker, fallbacks)."""
+        per_host = {}
+        for name, count in metrics.counter_group("outbound.").items():
+            host, event = name.rsplit(".", 1)
+            per_host.setdefault(host, {})[event] = count
+        for host, events in sorted(per_host.items()):
+            logger.info(f"Outbound {host}: " + ", ".join(f"{event} {count}" for event, count in sorted(events.items())))
+
+# Process-wide instance shared by every collector
+outbound = Outbound()
@@ -0,0 +1,62 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from src.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class PipelineAbort(Exception):
+    """Raised by a stage to stop the pipeline without treating it as a failure."""
+
+class Stage:
+    """
+    One node of the job graph. `fn` receives the dict of results produced so
+    far (keyed by stage name) and returns this stage's result.
+    """
+
+    def __init__(self, name, fn, deps=()):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+
+def _run_stage(stage, results):
+    with metrics.span(f"stage.{stage.name}"):
+        return stage.fn(results)
+
+def run_stages(stages, results=None, max_workers=4):
+    """
+    Runs the stages on a thread pool as soon as their dependencies are done,
+    so independent I/O overlaps. Fail-fast: the first exception (or
+    PipelineAbort) cancels every stage not yet started and is re-raised.
+    Returns the results dict, including any `results` passed in.
+    """
+    results = dict(results or {})
+    remaining = {stage.name: stage for stage in stages}
+
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in remaining and dep not in results]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {missing}")
+
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="stage")
+    running = {}
+    try:
+        while remaining or running:
+            for name, stage in list(remaining.items()):
+                if all(dep in results for dep in stage.deps):
+                    running[executor.submit(_run_stage, stage, results)] = name
+                    del remaining[name]
+
+            if not running:
+                raise ValueError(f"Dependency cycle between stages: {sorted(remaining)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                # .result() re-raises the stage's exception, which aborts the loop
+                results[name] = future.result()
+                logger.debug(f"Stage '{name}' finished.")
+    finally:
+        # Stages already running cannot be interrupted; their results are ignored
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results
@@ -1,193 +1,168 @@
 import pandas as pd
-import json
+import numpy as np
 import os
 from datetime import datetime
 from config.settings import Settings
+from src.history_store import HistoryStore
+from src.allocator import ContributionAllocator
+from src.metrics import metrics
 import logging
 
 logger = logging.getLogger(__name__)
 
 class PortfolioManager:
-    def __init__(self, portfolio_data, market_data, indicators):
+    def __init__(self, portfolio_data, market_data, indicators, target_allocation=None, history_path=None):
         self.portfolio_data = portfolio_data
         self.market_data = market_data
         self.indicators = indicators
-        self.target_alloc = Settings.TARGET_ALLOCATION
+        self.target_alloc = target_allocation or Settings.TARGET_ALLOCATION
+        self.history_path = history_path
+        self.carried = []
+        self.missing = []  # unquoted tickers of the last calculate_portfolio
         
         # Ensure data dir exists
         os.makedirs("data", exist_ok=True)
 
-    def _load_history(self):
-        """Loads history data from JSON file."""
-        history_file = "data/history.json"
-        try:
-            if os.path.exists(history_file):
-                with open(history_file, 'r') as f:
-                    return json.load(f)
-            return []
-        except Exception as e:
-            logger.error(f"Failed to load history.json: {e}")
-            return []
-
-    def _save_history(self, total_value):
-        """Saves daily total value to history."""
-        history_file = "data/history.json"
-        today = datetime.now().strftime("%Y-%m-%d")
-        
-        history = self._load_history()
-        
-        # Check if today is already in history, update if so
-        updated = False
-        for entry in history:
-            if entry['date'] == today:
-                entry['value'] = total_value
-                updated = True
-                break
-        
-        if not updated:
-            history.append({
-                "date": today,
-                "value": total_value
-            })
-            
-        try:
-            with open(history_file, 'w') as f:
-                json.dump(history, f, indent=2)
-        except Exception as e:
-            logger.error(f"Failed to save history.json: {e}")
+    # Columns read from market data and their defaults when a ticker/field is missing
+    MARKET_FIELDS = {
+        "price": 0.0,
+        "name": None,  # falls back to the ticker
+        "dy_12m": 0, "p_vp": 0, "pe": 0, "roe": 0,
+        "sector": "Unknown", "recommendation": "None",
+        "change_1d": 0, "change_12m": 0
+    }
+    # Map internal categories to Target Allocation keys
+    CATEGORY_MAP = Settings.CATEGORY_MAP
+    USD_CATEGORIES = ["US_REITS", "US_STOCKS"]
+    USD_FALLBACK_RATE = 6.00
 
-    def calculate_portfolio(self):
-        portfolio = []
-        total_value = 0
-        
-        # 1. Process Tickers from Sheet Data
-        for item in self.portfolio_data:
-            ticker = item['ticker']
-            qty = item['quantity'] # Note: key is 'quantity' from SheetsManager, not 'qty'
-            category = item.get('category', 'OUTROS')
-            
-            # Market Data
-            data = self.market_data.get(ticker, {})
-            current_price = data.get('price', 0)
-            
-            # --- LOGIC CORRECTIONS ---
-            
-            # 1. Renda Fixa: Value = Qty * 1.0
-            if category == "RENDA_FIXA":
-                value_brl = qty * 1.0
-                current_price = 1.0
-                avg_price_brl = 0 # Not tracking avg price for RF yet
-                
-            # 2. Crypto Logic
-            elif category == "CRYPTO":
-                if ticker.endswith("-BRL"):
-                    value_brl = current_price * qty
-                    avg_price_brl = 0
-                else:
-                    # USDT-USD, BTC-USD, etc.
-                    usd_rate = self.market_data.get('BRL=X', {}).get('price', 0)
-                    
-                    # Fallback de segurança se o Yahoo falhar no dólar
-                    if usd_rate <= 0:
-                        usd_rate = 6.00 # Taxa aproximada segura
-                        logger.warning("Usando taxa de dólar fallback (6.00) para conversão de cripto.")
-                        
-                    value_brl = current_price * qty * usd_rate
-                    avg_price_brl = 0
-
-            # 3. US Stocks/REITs -> Convert to BRL
-            elif category in ["US_REITS", "US_STOCKS"]:
-                usd_rate = self.market_data.get('BRL=X', {}).get('price', 0)
-                if usd_rate <= 0: 
-                    usd_rate = 6.00
-                    logger.warning("Usando taxa de dólar fallback (6.00) para ativos EUA.")
-                    
-                value_brl = current_price * qty * usd_rate
-                avg_price_brl = 0
-                
-            # 4. Brazilian Assets (Stocks, FIIs, ETFs, BDRs)
-            else:
-                value_brl = current_price * qty
-                avg_price_brl = 0
+    @classmethod
+    def usd_mask(cls, tickers, categories):
+        """Positions quoted in USD: US stocks/REITs and crypto pairs other than -BRL."""
+        categories = pd.Series(categories).reset_index(drop=True)
+        brl_pair = pd.Series(tickers, dtype=object).str.endswith("-BRL", na=False).to_numpy(dtype=bool)
+        return categories.isin(cls.USD_CATEGORIES).to_numpy() | ((categories == "CRYPTO").to_numpy() & ~brl_pair)
 
-            if current_price == 0 and category != "RENDA_FIXA":
-                logger.warning(f"Price for {ticker} is 0. Check data source.")
+    def value_positions(self, last_values=None):
+        """
+        Values every position in one columnar pass: positions are joined to
+        market data, FX is applied through a per-row multiplier and value,
+        P/L and allocation are computed as whole-array operations; the frame
+        is assembled once at the end.
+        `last_values` ({ticker: value_brl}, e.g. the last history entry's
+        positions) values positions left without a quote; their tickers are
+        kept in `self.carried`. Returns (df, total_value).
+        """
+        self.carried = []
+        if not self.portfolio_data:
+            df = pd.DataFrame()
+            df['allocation'] = 0
+            return df, 0
 
-            # Safety check for NaN
-            if pd.isna(value_brl):
-                value_brl = 0.0
+        tickers = [item['ticker'] for item in self.portfolio_data]
+        # Note: key is 'quantity' from SheetsManager, not 'qty'
+        quantities = [item['quantity'] for item in self.portfolio_data]
+        categories = pd.Series([item.get('category', 'OUTROS') for item in self.portfolio_data])
+
+        # Join positions to market data in one step (missing tickers/fields become NaN, then defaults)
+        market = pd.DataFrame([self.market_data.get(t, {}) for t in tickers], columns=list(self.MARKET_FIELDS))
+        if market.isna().to_numpy().any():
+            market = market.fillna({f: d for f, d in self.MARKET_FIELDS.items() if d is not None})
+            market['name'] = market['name'].fillna(pd.Series(tickers))
+
+        # --- LOGIC CORRECTIONS ---
+        # 1. Renda Fixa: Value = Qty * 1.0
+        # 2. Crypto: -BRL pairs are already in BRL, the rest (USDT-USD, BTC-USD...) are in USD
+        # 3. US Stocks/REITs -> Convert to BRL
+        # 4. Brazilian Assets (Stocks, FIIs, ETFs, BDRs): as is
+        is_rf = (categories == "RENDA_FIXA").to_numpy()
+        is_usd = self.usd_mask(tickers, categories)
+
+        usd_rate = self.market_data.get('BRL=X', {}).get('price', 0)
+        if is_usd.any() and usd_rate <= 0:
+            # Fallback de segurança se o Yahoo falhar no dólar
+            usd_rate = self.USD_FALLBACK_RATE
+            logger.warning(f"Usando taxa de dólar fallback ({self.USD_FALLBACK_RATE:.2f}) para ativos em USD.")
+
+        price = market['price'].to_numpy(dtype=float, copy=True)
+        price[is_rf] = 1.0
+        qty = np.asarray(quantities, dtype=float)
+        fx = np.where(is_usd, usd_rate, 1.0)
+        value = price * qty * fx
+        value[np.isnan(value)] = 0.0
+
+        zero_price = (price == 0) & ~is_rf
+        if last_values and zero_price.any():
+            # Carry the last recorded value (split by quantity if the ticker repeats) instead of 0
+            ticker_series = pd.Series(tickers)
+            carried = zero_price & ticker_series.isin([t for t, v in last_values.items() if v and v > 0]).to_numpy()
+            qty_share = qty / pd.Series(qty).groupby(ticker_series).transform('sum').to_numpy()
+            value[carried] = ticker_series[carried].map(last_values).to_numpy(dtype=float) * qty_share[carried]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                price[carried] = np.nan_to_num(value[carried] / (qty[carried] * fx[carried]))
+            self.carried = ticker_series[carried].tolist()
+            zero_price &= ~carried
+            for ticker in self.carried:
+                logger.warning(f"No quote for {ticker}: using its last recorded value from the history.")
+        for i in np.flatnonzero(zero_price):
+            logger.warning(f"Price for {tickers[i]} is 0. Check data source.")
+
+        # Calculate Profit/Loss (average price is not tracked yet, so cost is 0)
+        cost = np.zeros(len(tickers))
+        total_value = float(value.sum())
+        with np.errstate(divide='ignore', invalid='ignore'):
+            profit_loss_val = np.where(cost > 0, value - cost, 0.0)
+            profit_loss_pct = np.where(cost > 0, (value - cost) / cost * 100, 0.0)
+            allocation = value / total_value * 100
+
+        df = pd.DataFrame({
+            "ticker": tickers, "qty": quantities, "price": price, "value_brl": value,
+            "category": categories, "name": market['name'],
+            "dy_12m": market['dy_12m'], "p_vp": market['p_vp'], "pe": market['pe'], "roe": market['roe'],
+            "sector": market['sector'], "recommendation": market['recommendation'],
+            "change_1d": market['change_1d'], "change_12m": market['change_12m'],
+            "profit_loss_pct": profit_loss_pct, "profit_loss_val": profit_loss_val, "allocation": allocation
+        })
+        return df, total_value
+
+    def calculate_portfolio(self):
+        history = HistoryStore(self.history_path)
+        today = datetime.now().strftime("%Y-%m-%d")
+        last_entry = history.last_before(today)
+
+        # 1. Process Tickers from Sheet Data (failed quotes keep their last recorded value)
+        df, total_value = self.value_positions(last_entry.get('positions') if last_entry else None)
 
-            total_value += value_brl
-            
-            # Calculate Profit/Loss
-            if avg_price_brl > 0:
-                profit_loss_pct = ((value_brl - (avg_price_brl * qty)) / (avg_price_brl * qty)) * 100
-                profit_loss_val = value_brl - (avg_price_brl * qty)
-            else:
-                profit_loss_pct = 0.0
-                profit_loss_val = 0.0
-
-            portfolio.append({
-                "ticker": ticker,
-                "qty": qty,
-                "price": current_price,
-                "value_brl": value_brl,
-                "category": category,
-                "name": data.get('name', ticker),
-                "dy_12m": data.get('dy_12m', 0),
-                "p_vp": data.get('p_vp', 0),
-                "pe": data.get('pe', 0),
-                "roe": data.get('roe', 0),
-                "sector": data.get('sector', 'Unknown'),
-                "recommendation": data.get('recommendation', 'None'),
-                "change_1d": data.get('change_1d', 0),
-                "change_12m": data.get('change_12m', 0),
-                "profit_loss_pct": profit_loss_pct,
-                "profit_loss_val": profit_loss_val
-            })
-            
         # 2. History & Variation
-        history = self._load_history()
         daily_variation_pct = 0.0
-        
-        if history:
-            history.sort(key=lambda x: x['date'])
-            today = datetime.now().strftime("%Y-%m-%d")
-            last_entry = None
-            for entry in reversed(history):
-                if entry['date'] != today:
-                    last_entry = entry
-                    break
-            
-            if last_entry and last_entry['value'] > 0:
-                daily_variation_pct = ((total_value - last_entry['value']) / last_entry['value']) * 100
-
-        # Save today's value
-        self._save_history(total_value)
+        if last_entry and last_entry['value'] > 0:
+            daily_variation_pct = ((total_value - last_entry['value']) / last_entry['value']) * 100
 
-        df = pd.DataFrame(portfolio)
-        if not df.empty:
-            df['allocation'] = (df['value_brl'] / total_value) * 100
+        # Save today's value (with the per-position breakdown). A quote that just started failing
+        # (quoted on a recent saved day) holds the save back for up to HISTORY_MAX_SKIP_DAYS, waiting
+        # for a complete day; tickers that keep failing (typo, delisted) are saved as "missing".
+        missing = df.loc[(df['price'] <= 0) & (df['category'] != "RENDA_FIXA"), 'ticker'].tolist() if not df.empty else []
+        self.missing = sorted(set(missing + self.carried))
+        new_failures = set(self.missing) - set(last_entry.get('missing', [])) if last_entry else set()
+        recent = last_entry is not None and (
+            datetime.strptime(today, "%Y-%m-%d") - datetime.strptime(last_entry['date'], "%Y-%m-%d")
+        ).days <= Settings.HISTORY_MAX_SKIP_DAYS
+        if new_failures and recent:
+            logger.warning(f"No price for {sorted(new_failures)}: today's total is incomplete and is not saved to the history yet.")
+            metrics.incr("history.skipped")
         else:
-            df['allocation'] = 0
-        
+            if self.missing:
+                logger.warning(f"No price for {self.missing}: today's total is saved as partial.")
+                metrics.incr("history.partial")
+            positions = df.groupby('ticker')['value_brl'].sum().to_dict() if not df.empty else {}
+            history.upsert(today, total_value, positions, missing=self.missing)
+
         return df, total_value, daily_variation_pct
 
     def get_rebalancing_suggestions(self, df, total_value):
-        # Map internal categories to Target Allocation keys
-        cat_map = {
-            "BR_STOCKS": "Ações BR",
-            "FIIS": "FIIs",
-            "ETFS": "ETFs",
-            "US_REITS": "REITs",
-            "US_STOCKS": "Ações EUA",
-            "CRYPTO": "Cripto",
-            "RENDA_FIXA": "Renda Fixa"
-        }
-        
         # Group by category
         if not df.empty:
-            df['target_cat'] = df['category'].map(cat_map)
+            df['target_cat'] = df['category'].map(self.CATEGORY_MAP)
             current_alloc = df.groupby('target_cat')['value_brl'].sum() / total_value
         else:
             current_alloc = pd.Series()
@@ -214,7 +189,18 @@ class PortfolioManager:
             
         return pd.DataFrame(suggestions)
 
-    def suggest_contribution(self, amount, df_suggestions):
+    def suggest_orders(self, amount, df, total_value):
+        """Whole-share buy orders for `amount` (see ContributionAllocator). Returns (orders, leftover)."""
+        return ContributionAllocator(self.target_alloc).allocate(df, total_value, amount)
+
+    def suggest_contribution(self, amount, df_suggestions, orders=None):
+        # With buy orders (suggest_orders), the contribution per category is what they actually spend
+        if orders is not None:
+            if orders.empty:
+                return "Nenhuma sugestão específica (alocação equilibrada)."
+            per_class = orders.groupby('class', sort=False)['cost'].sum()
+            return pd.DataFrame({'category': per_class.index, 'contribution': per_class.to_numpy()})
+
         # Simple logic: Distribute amount to categories with biggest negative deviation (COMPRAR)
         # Prioritize Variable Income if RF > 40% (User rule: "priorizar variável enquanto RF >40%")
         
@@ -225,7 +211,7 @@ class PortfolioManager:
         # Filter candidates
         candidates = df_suggestions[df_suggestions['diff'] < 0].copy()
         
-        if rf_pct > 40:
+        if rf_pct > Settings.RF_PRIORITY_THRESHOLD:
             # Exclude RF from contributions
             candidates = candidates[candidates['category'] != "Renda Fixa"]
             
@@ -0,0 +1,151 @@
+import sqlite3
+import os
+import logging
+import pandas as pd
+from datetime import datetime, timedelta
+from config.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+class PriceStore:
+    """
+    Local SQLite store of daily closes keyed by (ticker, date).
+    A coverage table remembers which date range was already downloaded for
+    each ticker, so DataCollector only asks Yahoo for the missing tail.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or Settings.PRICE_STORE_PATH
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS prices (
+                ticker TEXT NOT NULL,
+                date TEXT NOT NULL,
+                close REAL,
+                PRIMARY KEY (ticker, date)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS coverage (
+                ticker TEXT PRIMARY KEY,
+                start TEXT NOT NULL,
+                end TEXT NOT NULL,
+                fetched_at TEXT NOT NULL
+            );
+        """)
+
+    def close(self):
+        self.conn.close()
+
+    def plan_downloads(self, tickers, start, today=None):
+        """
+        Returns {fetch_start: [tickers]} with the date each ticker must be
+        downloaded from. Tickers fetched within PRICE_STORE_MAX_AGE_MINUTES
+        are skipped. The last stored bar is always re-fetched because the
+        daily run happens during market hours and that close may be partial.
+        """
+        today = today or datetime.now().date()
+        max_age = timedelta(minutes=Settings.PRICE_STORE_MAX_AGE_MINUTES)
+        rows = {}
+        if tickers:
+            placeholders = ",".join("?" * len(tickers))
+            rows = {
+                row[0]: row[1:] for row in self.conn.execute(
+                    f"SELECT ticker, start, end, fetched_at FROM coverage WHERE ticker IN ({placeholders})",
+                    list(tickers)
+                )
+            }
+
+        plan = {}
+        for ticker in tickers:
+            cov = rows.get(ticker)
+            if cov is None or cov[0] > start.isoformat():
+                fetch_start = start
+            else:
+                fetched_at = datetime.fromisoformat(cov[2])
+                if cov[1] == today.isoformat() and datetime.now() - fetched_at < max_age:
+                    continue
+                fetch_start = datetime.fromisoformat(cov[1]).date()
+            plan.setdefault(fetch_start, []).append(ticker)
+        return plan
+
+    def upsert(self, panel, start, end):
+        """Merges a wide close panel (date index x ticker columns) into the store."""
+        if panel.empty:
+            return
+
+        long = panel.stack().dropna().reset_index()
+        long.columns = ['date', 'ticker', 'close']
+        long['date'] = pd.to_datetime(long['date']).dt.strftime('%Y-%m-%d')
+
+        now = datetime.now().isoformat(timespec='seconds')
+        fetched = long['ticker'].unique().tolist()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO prices (ticker, date, close) VALUES (?, ?, ?)",
+                long[['ticker', 'date', 'close']].itertuples(index=False, name=None)
+            )
+            # Only tickers that actually returned data are marked as covered,
+            # so a failed download is retried on the next run.
+            self.conn.executemany(
+                """INSERT INTO coverage (ticker, start, end, fetched_at) VALUES (?, ?, ?, ?)
+                   ON CONFLICT(ticker) DO UPDATE SET
+                       start = MIN(coverage.start, excluded.start),
+                       end = excluded.end,
+                       fetched_at = excluded.fetched_at""",
+                [(ticker, start.isoformat(), end.isoformat(), now) for ticker in fetched]
+            )
+
+    def load_panel(self, tickers, start):
+        """Returns the stored closes since `start` as a wide DataFrame."""
+        if not tickers:
+            return pd.DataFrame()
+
+        placeholders = ",".join("?" * len(tickers))
+        long = pd.read_sql_query(
+            f"SELECT ticker, date, close FROM prices WHERE date >= ? AND ticker IN ({placeholders})",
+            self.conn, params=[start.isoformat(), *tickers]
+        )
+        panel = long.pivot(index='date', columns='ticker', values='close')
+        panel.index = pd.to_datetime(panel.index)
+        return panel.sort_index().reindex(columns=tickers)
+
+    def last_closes(self, tickers):
+        """Returns {ticker: most recent stored close}, whatever its date, for the tickers that have one."""
+        if not tickers:
+            return {}
+
+        placeholders = ",".join("?" * len(tickers))
+        rows = self.conn.execute(
+            f"SELECT ticker, close FROM prices p WHERE ticker IN ({placeholders}) AND close IS NOT NULL "
+            f"AND date = (SELECT MAX(date) FROM prices WHERE ticker = p.ticker AND close IS NOT NULL)",
+            list(tickers)
+        )
+        return {ticker: close for ticker, close in rows if close > 0}
+
+    def find_adjusted(self, panel, before, tolerance=0.001):
+        """
+        Compares freshly downloaded closes before `before` with the stored
+        ones and returns the tickers whose history was re-based by Yahoo
+        (splits/dividends change every past adjusted close).
+        """
+        overlap = panel[panel.index < pd.Timestamp(before)]
+        if overlap.empty:
+            return []
+
+        stored = self.load_panel(list(panel.columns), overlap.index.min().date())
+        stored = stored.reindex(index=overlap.index, columns=overlap.columns)
+        drift = ((overlap - stored).abs() / stored.abs()) > tolerance
+        return drift.any()[lambda flags: flags].index.tolist()
+
+    def invalidate(self, tickers):
+        """Forgets everything stored for the given tickers."""
+        with self.conn:
+            for ticker in tickers:
+                self.conn.execute("DELETE FROM prices WHERE ticker = ?", (ticker,))
+                self.conn.execute("DELETE FROM coverage WHERE ticker = ?", (ticker,))
+
+    def prune(self, before):
+        """Drops closes older than `before` to keep the file bounded."""
+        with self.conn:
+            self.conn.execute("DELETE FROM prices WHERE date < ?", (before.isoformat(),))
+            self.conn.execute("UPDATE coverage SET start = ? WHERE start < ?", (before.isoformat(), before.isoformat()))
@@ -0,0 +1,134 @@
+import math
+import logging
+import pandas as pd
+from config.settings import Settings
+from src.portfolio import PortfolioManager
+from src.risk import RiskAnalyzer
+
+logger = logging.getLogger(__name__)
+
+PROMPT_TEMPLATE = """
+        Você é um Gestor de Portfólio Sênior. Analise a carteira com base no contexto:
+
+        NOTÍCIAS DO DIA:
+        {news_summary}
+
+        DADOS DA CARTEIRA:
+        {summary_text}
+
+        Gere uma análise direta e executiva sobre o que fazer hoje.
+        """
+
+class PromptBuilder:
+    """
+    Builds the AIAnalyst prompt under an explicit token budget.
+
+    Instead of one line per asset, the portfolio is described by category
+    totals (with drift from the target allocation), the top-K assets by
+    1D move, by P/L and by allocation, and one summary line per category
+    for the remaining long tail. Detailed and tail lines share a fixed
+    budget of 3 * top_k lines, so a large portfolio trades highlight lines
+    for tail summaries instead of growing; at most top_k tail lines are
+    written, the smallest categories sharing the last one. If the estimate
+    still exceeds the token budget, the least relevant asset lines move
+    into the tail.
+    """
+    CHARS_PER_TOKEN = 4
+
+    def __init__(self, token_budget=None, top_k=None, target_allocation=None):
+        self.token_budget = token_budget or Settings.AI_PROMPT_TOKEN_BUDGET
+        self.top_k = top_k or Settings.AI_PROMPT_TOP_K
+        self.target_alloc = target_allocation or Settings.TARGET_ALLOCATION
+
+    @classmethod
+    def estimate_tokens(cls, text):
+        return math.ceil(len(text) / cls.CHARS_PER_TOKEN)
+
+    @staticmethod
+    def _asset_line(item):
+        return (f"- {item['ticker']} ({item['category']}): R$ {item['value_brl']:.2f} "
+                f"({item['allocation']:.1f}%) | Var. 1D: {item.get('change_1d', 0):.2f}% | "
+                f"L/P: {item.get('profit_loss_pct', 0):.2f}% | "
+                f"P/L: {item.get('pe', 0):.1f} | ROE: {item.get('roe', 0):.1f}% | Rec: {item.get('recommendation', 'N/A')}")
+
+    def _priority(self, df):
+        """Tickers ordered by relevance: round-robin over the top-K movers, P/L outliers and largest positions."""
+        rankings = [
+            df['change_1d'].abs().nlargest(self.top_k).index,
+            df['profit_loss_pct'].abs().nlargest(self.top_k).index,
+            df['allocation'].nlargest(self.top_k).index,
+        ]
+        ordered = []
+        for rank in range(self.top_k):
+            for ranking in rankings:
+                if rank < len(ranking) and ranking[rank] not in ordered:
+                    ordered.append(ranking[rank])
+        return ordered
+
+    def _category_lines(self, df, total_value):
+        grouped = df.groupby('category').agg(value=('value_brl', 'sum'), count=('ticker', 'size'))
+        lines = []
+        for category, row in grouped.sort_values('value', ascending=False).iterrows():
+            pct = row['value'] / total_value * 100 if total_value else 0.0
+            line = f"- {category}: R$ {row['value']:,.2f} ({pct:.1f}%) | {int(row['count'])} ativos"
+            target = self.target_alloc.get(PortfolioManager.CATEGORY_MAP.get(category))
+            if target is not None:
+                line += f" | meta {target * 100:.0f}% | desvio {pct - target * 100:+.1f} p.p."
+            lines.append(line)
+        return lines
+
+    @staticmethod
+    def _summary_line(label, group):
+        value = group['value_brl'].sum()
+        weighted_1d = (group['change_1d'] * group['value_brl']).sum() / value if value else 0.0
+        return (f"- {label}: +{len(group)} outros ativos, R$ {value:,.2f} "
+                f"({group['allocation'].sum():.1f}%) | Var. 1D média {weighted_1d:.2f}%")
+
+    def _tail_lines(self, tail):
+        """One line per category, largest first; beyond top_k lines the smallest categories share one line."""
+        if tail.empty:
+            return []
+        values = tail.groupby('category')['value_brl'].sum().sort_values(ascending=False)
+        shown = list(values.index[:self.top_k - 1] if len(values) > self.top_k else values.index)
+        lines = [self._summary_line(category, tail[tail['category'] == category]) for category in shown]
+        rest = tail[~tail['category'].isin(shown)]
+        if not rest.empty:
+            lines.append(self._summary_line("Outras categorias", rest))
+        return lines
+
+    def _render(self, df, total_value, indicators, news_summary, detailed, risk=None):
+        summary_text = f"Valor Total: R$ {total_value:,.2f}\n"
+        summary_text += f"Indicadores: Selic {indicators.get('selic_meta')}% | CDI {indicators.get('cdi')}% | PTAX {indicators.get('ptax_venda')}\n"
+        if risk:
+            summary_text += RiskAnalyzer.summary_line(risk) + "\n"
+
+        if not df.empty:
+            summary_text += "Alocação por categoria:\n" + "\n".join(self._category_lines(df, total_value)) + "\n"
+            if detailed:
+                summary_text += "Destaques (maiores variações, L/P e posições):\n"
+                summary_text += "\n".join(self._asset_line(df.loc[i]) for i in detailed) + "\n"
+            tail_lines = self._tail_lines(df.drop(index=detailed))
+            if tail_lines:
+                summary_text += "Demais ativos (resumo):\n" + "\n".join(tail_lines) + "\n"
+
+        return PROMPT_TEMPLATE.format(news_summary=news_summary, summary_text=summary_text)
+
+    def build(self, portfolio_df, total_value, indicators, news_summary, risk=None):
+        """Returns (prompt, estimated_tokens). `risk` is RiskAnalyzer.analyze output (optional)."""
+        df = portfolio_df.reset_index(drop=True) if not portfolio_df.empty else pd.DataFrame()
+        detailed = self._priority(df) if not df.empty else []
+
+        # Keep highlights + tail summaries within a constant number of lines
+        max_lines = 3 * self.top_k
+        while detailed and len(detailed) + min(df.drop(index=detailed)['category'].nunique(), self.top_k) > max_lines:
+            detailed = detailed[:-1]
+
+        prompt = self._render(df, total_value, indicators, news_summary, detailed, risk)
+        while detailed and self.estimate_tokens(prompt) > self.token_budget:
+            detailed = detailed[:-1]
+            prompt = self._render(df, total_value, indicators, news_summary, detailed, risk)
+
+        tokens = self.estimate_tokens(prompt)
+        if tokens > self.token_budget:
+            logger.warning(f"Prompt estimado em {tokens} tokens, acima do orçamento de {self.token_budget}.")
+        return prompt, tokens
@@ -1,67 +1,112 @@
-import pandas as pd
 from datetime import datetime
 import os
-import re
-import matplotlib.pyplot as plt
 import io
+import json
 import base64
+import hashlib
+import logging
+from config.settings import Settings
+from src.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Bump when the chart's look changes so cached images are not reused
+CHART_STYLE_VERSION = 1
+CHART_COLORS = ['#ff9999','#66b3ff','#99ff99','#ffcc99', '#c2c2f0', '#ffb3e6', '#c4e17f']
+CHART_MIME_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
 
 class ReportGenerator:
-    def __init__(self):
-        pass
+    def __init__(self, chart_format=None, chart_cache_dir=None):
+        self.chart_format = (chart_format or Settings.CHART_FORMAT).lower()
+        if self.chart_format not in CHART_MIME_TYPES:
+            raise ValueError(f"Unsupported chart format '{self.chart_format}', expected one of {sorted(CHART_MIME_TYPES)}")
+        self.chart_cache_dir = chart_cache_dir or Settings.CHART_CACHE_DIR
+
+    @property
+    def chart_mime_type(self):
+        return CHART_MIME_TYPES[self.chart_format]
+
+    @staticmethod
+    def _table_rows(df, row_format):
+        """
+        Formats every row of `df` with `row_format` (str.format fields named
+        after columns) in one pass over the column arrays, without iterrows.
+        """
+        columns = list(df.columns)
+        return (row_format.format(**dict(zip(columns, values)))
+                for values in zip(*(df[column].tolist() for column in columns)))
 
-    def generate_markdown_report(self, portfolio_df, total_value, suggestions_df, contribution_df, indicators, ai_analysis=None):
+    def generate_markdown_report(self, portfolio_df, total_value, suggestions_df, contribution_df, indicators, ai_analysis=None, out=None):
+        """
+        Writes the Markdown report to `out` (any text stream: a file,
+        io.StringIO, socket.makefile('w')) piece by piece. Without `out` the
+        report is returned as a string. Positions are grouped in a single
+        groupby pass, so time and memory grow linearly with their number.
+        """
+        if out is None:
+            buffer = io.StringIO()
+            self.generate_markdown_report(portfolio_df, total_value, suggestions_df, contribution_df, indicators, ai_analysis, out=buffer)
+            return buffer.getvalue()
+
+        write = out.write
         today = datetime.now().strftime("%d/%m/%Y")
         
         # Resumo Executivo
-        report = f"# 📊 Relatório Financeiro Diário - {today}\n\n"
+        write(f"# 📊 Relatório Financeiro Diário - {today}\n\n")
         
         if ai_analysis:
-            report += "## 🧠 Análise de IA\n"
-            report += f"{ai_analysis}\n\n"
+            write("## 🧠 Análise de IA\n")
+            write(f"{ai_analysis}\n\n")
         else:
-            report += "## 📝 Resumo Executivo\n"
-            report += f"- **Valor Total da Carteira**: R$ {total_value:,.2f}\n"
+            write("## 📝 Resumo Executivo\n")
+            write(f"- **Valor Total da Carteira**: R$ {total_value:,.2f}\n")
             selic = indicators.get('selic_meta', 0)
             cdi = indicators.get('cdi', 0)
             ptax = indicators.get('ptax_venda', 0)
-            report += f"- **Indicadores**: Selic {selic}% | CDI {cdi:.2f}% | PTAX R$ {ptax:.4f}\n\n"
+            write(f"- **Indicadores**: Selic {selic}% | CDI {cdi:.2f}% | PTAX R$ {ptax:.4f}\n\n")
         
         # Alocação Atual vs Ideal
-        report += "## ⚖️ Alocação de Ativos\n"
-        report += "| Categoria | Atual % | Ideal % | Status |\n"
-        report += "|---|---|---|---|\n"
-        
-        for _, row in suggestions_df.iterrows():
-            report += f"| {row['category']} | {row['current_pct']:.1f}% | {row['target_pct']:.1f}% | {row['status']} |\n"
-            
-        report += "\n"
+        write("## ⚖️ Alocação de Ativos\n")
+        write("| Categoria | Atual % | Ideal % | Status |\n")
+        write("|---|---|---|---|\n")
+        out.writelines(self._table_rows(
+            suggestions_df[['category', 'current_pct', 'target_pct', 'status']],
+            "| {category} | {current_pct:.1f}% | {target_pct:.1f}% | {status} |\n"
+        ))
+        write("\n")
         
-        # Detalhe por Ativo
-        report += "## 📈 Detalhe da Carteira\n"
-        cats = portfolio_df['category'].unique()
-        for cat in cats:
-            cat_df = portfolio_df[portfolio_df['category'] == cat]
-            report += f"### {cat}\n"
-            report += "| Ativo | Qtd | Preço | Valor Total | Var. 1D | Var. 12M |\n"
-            report += "|---|---|---|---|---|---|\n"
-            for _, row in cat_df.iterrows():
-                report += f"| {row['name']} ({row['ticker']}) | {row['qty']} | R$ {row['price']:,.2f} | R$ {row['value_brl']:,.2f} | {row['change_1d']:.2f}% | {row['change_12m']:.2f}% |\n"
-            report += "\n"
+        # Detalhe por Ativo (categorias na ordem em que aparecem)
+        write("## 📈 Detalhe da Carteira\n")
+        detail_cols = ['name', 'ticker', 'qty', 'price', 'value_brl', 'change_1d', 'change_12m']
+        for cat, cat_df in portfolio_df.groupby('category', sort=False):
+            write(f"### {cat}\n")
+            write("| Ativo | Qtd | Preço | Valor Total | Var. 1D | Var. 12M |\n")
+            write("|---|---|---|---|---|---|\n")
+            out.writelines(self._table_rows(
+                cat_df[detail_cols],
+                "| {name} ({ticker}) | {qty} | R$ {price:,.2f} | R$ {value_brl:,.2f} | {change_1d:.2f}% | {change_12m:.2f}% |\n"
+            ))
+            write("\n")
             
         # Sugestão de Aporte
-        report += "## 💰 Sugestão de Aporte Mensal (R$ 250,00)\n"
+        write("## 💰 Sugestão de Aporte Mensal (R$ 250,00)\n")
         if isinstance(contribution_df, str):
-             report += f"{contribution_df}\n"
+             write(f"{contribution_df}\n")
         else:
-            report += "| Categoria | Valor Sugerido |\n"
-            report += "|---|---|\n"
-            for _, row in contribution_df.iterrows():
-                report += f"| {row['category']} | R$ {row['contribution']:,.2f} |\n"
-                
-        return report
+            write("| Categoria | Valor Sugerido |\n")
+            write("|---|---|\n")
+            out.writelines(self._table_rows(
+                contribution_df[['category', 'contribution']],
+                "| {category} | R$ {contribution:,.2f} |\n"
+            ))
 
     def generate_allocation_chart(self, portfolio_df):
+        """
+        Returns the allocation donut as a base64 string (PNG or SVG, see
+        `chart_mime_type`). The image only depends on the category shares
+        rounded to 0.1%, so it is cached on disk under that key and repeated
+        runs with unchanged allocations never import matplotlib.
+        """
         # Agrupa por categoria e preenche NaNs
         data = portfolio_df.groupby('category')['value_brl'].sum().fillna(0)
         
@@ -70,30 +115,76 @@ class ReportGenerator:
         
         if data.empty:
             return ""
-        
-        # Configurações visuais
-        colors_list = ['#ff9999','#66b3ff','#99ff99','#ffcc99', '#c2c2f0', '#ffb3e6', '#c4e17f']
-        plt.figure(figsize=(6, 6))
-        
+
+        shares = (data / data.sum() * 100).round(1)
+        key = hashlib.sha256(json.dumps(
+            [CHART_STYLE_VERSION, self.chart_format, Settings.CHART_DPI, list(shares.items())]
+        ).encode("utf-8")).hexdigest()[:16]
+        cache_path = os.path.join(self.chart_cache_dir, f"allocation-{key}.{self.chart_format}")
+
+        if Settings.CHART_CACHE_ENABLED and os.path.exists(cache_path):
+            metrics.incr("cache.chart.hit")
+            os.utime(cache_path)
+            with open(cache_path, 'rb') as f:
+                return base64.b64encode(f.read()).decode('utf-8')
+
+        metrics.incr("cache.chart.miss")
+        with metrics.span("chart.render", format=self.chart_format):
+            image = self._render_allocation_chart(shares)
+
+        if Settings.CHART_CACHE_ENABLED:
+            self._save_chart(cache_path, image)
+        return base64.b64encode(image).decode('utf-8')
+
+    def _render_allocation_chart(self, shares):
+        # Object-oriented Agg API: no pyplot global state, safe to run on a worker thread
+        from matplotlib import rc_context
+        from matplotlib.figure import Figure
+        from matplotlib.patches import Circle
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        fig = Figure(figsize=(6, 6), dpi=Settings.CHART_DPI)
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+
         # Gráfico
-        plt.pie(data, labels=data.index, colors=colors_list[:len(data)], autopct='%1.1f%%', startangle=90, pctdistance=0.85)
-        
+        ax.pie(shares, labels=shares.index, colors=CHART_COLORS[:len(shares)], autopct='%1.1f%%', startangle=90, pctdistance=0.85)
+
         # Círculo branco (Donut)
-        centre_circle = plt.Circle((0,0),0.70,fc='white')
-        fig = plt.gcf()
-        fig.gca().add_artist(centre_circle)
-        
-        plt.title('Alocação Atual da Carteira')
-        plt.tight_layout()
-        
-        # --- A MÁGICA ACONTECE AQUI ---
-        # Em vez de salvar em arquivo, salvamos na memória (buffer)
+        ax.add_artist(Circle((0, 0), 0.70, fc='white'))
+
+        ax.set_title('Alocação Atual da Carteira')
+        fig.tight_layout()
+
         buffer = io.BytesIO()
-        plt.savefig(buffer, format='png')
-        plt.close()
-        buffer.seek(0)
-        
-        # Converte para Base64 string
-        image_png = buffer.getvalue()
-        graphic = base64.b64encode(image_png)
-        return graphic.decode('utf-8')
+        if self.chart_format == "svg":
+            # Text stays text (not glyph paths), which keeps the SVG small
+            with rc_context({'svg.fonttype': 'none'}):
+                fig.savefig(buffer, format='svg', metadata={'Date': None})
+            return buffer.getvalue()
+
+        # Flat-colour chart: a 64-colour palette PNG is a fraction of the RGBA size
+        from PIL import Image
+        canvas.draw()
+        rgba = Image.frombuffer("RGBA", canvas.get_width_height(), canvas.buffer_rgba(), "raw", "RGBA", 0, 1)
+        rgba.convert("RGB").quantize(colors=64).save(buffer, format='PNG', optimize=True)
+        return buffer.getvalue()
+
+    def _save_chart(self, path, image):
+        try:
+            os.makedirs(self.chart_cache_dir, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(image)
+            os.replace(tmp_path, path)
+
+            # Keep only the most recently used charts
+            charts = sorted(
+                (os.path.join(self.chart_cache_dir, name) for name in os.listdir(self.chart_cache_dir)
+                 if name.startswith("allocation-")),
+                key=os.path.getmtime
+            )
+            for old in charts[:-Settings.CHART_CACHE_MAX_FILES]:
+                os.remove(old)
+        except Exception as e:
+            logger.error(f"Failed to save chart cache: {e}")
@@ -0,0 +1,151 @@
+import logging
+import warnings
+import numpy as np
+import pandas as pd
+from config.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+TRADING_DAYS = 252
+
+class RiskAnalyzer:
+    """
+    Risk metrics from the one-year close panel DataCollector already
+    downloaded (MarketData.history), so nothing extra is fetched.
+
+    Closes are converted to BRL, forward-filled across market calendars and
+    turned into one (days x assets) matrix of daily returns; every metric is
+    then a whole-matrix operation. Fixed income has no price history and is
+    treated as riskless cash: it dilutes portfolio risk by its weight.
+    """
+
+    USD_CATEGORIES = ["US_REITS", "US_STOCKS"]
+
+    def __init__(self, confidence=None, benchmark=None):
+        self.confidence = confidence or Settings.RISK_CONFIDENCE
+        self.benchmark = Settings.RISK_BENCHMARK if benchmark is None else benchmark
+
+    def _returns(self, panel, categories):
+        """Daily BRL returns per ticker (NaN before a ticker's first close)."""
+        closes = panel.ffill()
+        if 'BRL=X' in closes:
+            usd = [t for t in closes.columns if categories.get(t) in self.USD_CATEGORIES
+                   or (categories.get(t) == "CRYPTO" and not t.endswith("-BRL"))]
+            if usd:
+                closes[usd] = closes[usd].mul(closes['BRL=X'].bfill(), axis=0)
+        return closes, closes.pct_change(fill_method=None).iloc[1:]
+
+    def _tail(self, returns):
+        """Historical VaR and CVaR (positive = loss) of every column, ignoring NaNs."""
+        # Columns without any close (all NaN) stay NaN
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            cutoff = np.nanquantile(returns, 1 - self.confidence, axis=0)
+            cvar = np.nanmean(np.where(returns <= cutoff, returns, np.nan), axis=0)
+        return -cutoff, -cvar
+
+    @staticmethod
+    def _max_drawdown(closes):
+        running = np.fmax.accumulate(closes, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            drawdown = 1 - closes / running
+        return np.nan_to_num(drawdown).max(axis=0)
+
+    def analyze(self, panel, portfolio_df, total_value):
+        """
+        Returns a dict with 'portfolio' (annual volatility, 1-day VaR/CVaR in
+        % and R$, max drawdown, beta), 'assets' (per-ticker volatility,
+        VaR, CVaR, drawdown, beta, weight and share of portfolio risk, in %),
+        'covariance' and 'correlation' (annualized, DataFrames), or None when
+        there is not enough history.
+        """
+        if panel is None or panel.empty or portfolio_df.empty or not total_value:
+            return None
+
+        positions = portfolio_df.groupby('ticker').agg(value_brl=('value_brl', 'sum'), category=('category', 'first'))
+        categories = positions['category'].to_dict()
+        tickers = [t for t in positions.index if t in panel.columns and positions.at[t, 'value_brl'] > 0]
+        if not tickers:
+            return None
+
+        has_benchmark = bool(self.benchmark) and self.benchmark in panel.columns
+        columns = tickers + (['BRL=X'] if 'BRL=X' in panel.columns and 'BRL=X' not in tickers else [])
+        columns += [self.benchmark] if has_benchmark and self.benchmark not in columns else []
+        closes, returns = self._returns(panel[columns], categories)
+        if len(returns) < 20:
+            logger.warning(f"Not enough price history for risk metrics ({len(returns)} days).")
+            return None
+
+        asset_closes = closes[tickers].to_numpy(dtype=float)
+        asset_returns = returns[tickers].to_numpy(dtype=float)
+        weights = positions.loc[tickers, 'value_brl'].to_numpy(dtype=float) / total_value
+
+        # A day without a close (other market's holiday, not yet listed) counts as no move
+        filled = np.nan_to_num(asset_returns)
+        covariance = np.atleast_2d(np.cov(filled, rowvar=False)) * TRADING_DAYS
+        stdev = np.sqrt(np.diag(covariance))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            correlation = covariance / np.outer(stdev, stdev)
+
+        portfolio_returns = filled @ weights
+        portfolio_variance = float(weights @ covariance @ weights)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            risk_share = np.where(portfolio_variance > 0, weights * (covariance @ weights) / portfolio_variance, 0.0)
+
+        var, cvar = self._tail(np.column_stack([asset_returns, portfolio_returns]))
+        drawdown = self._max_drawdown(np.column_stack([asset_closes, np.cumprod(np.r_[1.0, 1 + portfolio_returns])]))
+
+        beta = np.full(len(tickers) + 1, np.nan)
+        if has_benchmark:
+            market = np.nan_to_num(returns[self.benchmark].to_numpy(dtype=float))
+            market_var = market.var(ddof=1)
+            if market_var > 0:
+                centered = np.column_stack([filled, portfolio_returns])
+                centered = centered - centered.mean(axis=0)
+                beta = centered.T @ (market - market.mean()) / (len(market) - 1) / market_var
+
+        assets = pd.DataFrame({
+            'ticker': tickers,
+            'weight': weights * 100,
+            'volatility': stdev * 100,
+            'var': var[:-1] * 100,
+            'cvar': cvar[:-1] * 100,
+            'max_drawdown': drawdown[:-1] * 100,
+            'beta': beta[:-1],
+            'risk_share': risk_share * 100
+        }).sort_values('risk_share', ascending=False, ignore_index=True)
+
+        return {
+            'portfolio': {
+                'volatility': float(np.sqrt(portfolio_variance) * 100),
+                'var_pct': float(var[-1] * 100),
+                'var_brl': float(var[-1] * total_value),
+                'cvar_pct': float(cvar[-1] * 100),
+                'cvar_brl': float(cvar[-1] * total_value),
+                'max_drawdown': float(drawdown[-1] * 100),
+                'beta': float(beta[-1]),
+                'confidence': self.confidence * 100,
+                'benchmark': self.benchmark if has_benchmark else None,
+                'days': len(returns)
+            },
+            'assets': assets,
+            'covariance': pd.DataFrame(covariance, index=tickers, columns=tickers),
+            'correlation': pd.DataFrame(correlation, index=tickers, columns=tickers)
+        }
+
+    @staticmethod
+    def summary_line(risk):
+        """One line for the AI prompt; empty when there are no metrics."""
+        if not risk:
+            return ""
+        p = risk['portfolio']
+        line = (f"Risco (1 ano): Vol. {p['volatility']:.1f}% a.a. | VaR {p['confidence']:.0f}% 1D "
+                f"{p['var_pct']:.2f}% (R$ {p['var_brl']:,.2f}) | CVaR {p['cvar_pct']:.2f}% | "
+                f"Drawdown máx. {p['max_drawdown']:.1f}%")
+        if p['benchmark'] and np.isfinite(p['beta']):
+            line += f" | Beta vs {p['benchmark']} {p['beta']:.2f}"
+        top = risk['assets'].head(3)
+        if not top.empty:
+            line += " | Maior contribuição ao risco: " + ", ".join(
+                f"{t} {s:.0f}%" for t, s in zip(top['ticker'], top['risk_share']))
+        return line
@@ -1,62 +1,218 @@
-import pandas as pd
+import csv
+import io
+import os
+import json
+import hashlib
 import logging
+import urllib.error
+import urllib.request
+from datetime import datetime
 from config.settings import Settings
+from src.metrics import metrics
+from src.outbound import outbound
 
 logger = logging.getLogger(__name__)
 
+# Expected columns: Ticker, Quantidade, Categoria, Meta
+REQUIRED_COLUMNS = ['Ticker', 'Quantidade', 'Categoria', 'Meta']
+
 class SheetsManager:
     @staticmethod
-    def get_portfolio_from_sheets():
-        """Reads portfolio data from Google Sheets CSV."""
-        url = Settings.SHEET_CSV_URL
+    def parse_quantity(value):
+        """'R$ 1.234,56' -> 1234.56; raises ValueError when not a number."""
+        # Clean Quantity (remove R$, dots, replace comma with dot)
+        qty_str = str(value)
+        qty_str = qty_str.replace('R$', '').replace(' ', '').replace('.', '').replace(',', '.')
+        return float(qty_str)
+
+    @staticmethod
+    def parse_meta(value):
+        """'12,5%' -> 12.5; unparseable targets count as 0."""
+        # Clean Meta (Target Allocation)
+        meta_str = str(value)
+        meta_str = meta_str.replace('%', '').replace(' ', '').replace(',', '.')
+        try:
+            return float(meta_str)
+        except ValueError:
+            return 0.0
+
+    @staticmethod
+    def _snapshot_paths(url):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+        base = os.path.join(Settings.SHEET_SNAPSHOT_DIR, key)
+        return f"{base}.csv", f"{base}.json"
+
+    @staticmethod
+    def _fetch(request, timeout):
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.read(), response.headers
+
+    @staticmethod
+    def download_csv(url, timeout=30, fallback=True):
+        """
+        Returns the sheet's CSV text. The request is conditional
+        (If-None-Match / If-Modified-Since from the last good download), so
+        an unchanged sheet costs one 304 and is read from the local
+        snapshot. With `fallback`, a failed download also falls back to the
+        snapshot. Returns None when there is nothing to use.
+        """
+        csv_path, meta_path = SheetsManager._snapshot_paths(url)
+        meta = {}
+        if os.path.exists(csv_path) and os.path.exists(meta_path):
+            try:
+                with open(meta_path, 'r') as f:
+                    meta = json.load(f)
+            except Exception as e:
+                logger.warning(f"Failed to load sheet snapshot metadata: {e}")
+
+        request = urllib.request.Request(url)
+        if meta.get("etag"):
+            request.add_header("If-None-Match", meta["etag"])
+        if meta.get("last_modified"):
+            request.add_header("If-Modified-Since", meta["last_modified"])
+
+        try:
+            with metrics.span("sheets.download"):
+                body, headers = outbound.call("sheets", SheetsManager._fetch, request, timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and meta:
+                logger.info("Planilha inalterada (304), usando a cópia local.")
+                metrics.incr("cache.sheet.hit")
+                with open(csv_path, 'r', encoding='utf-8') as f:
+                    return f.read()
+            return SheetsManager._download_failed(csv_path, e, fallback)
+        except Exception as e:
+            return SheetsManager._download_failed(csv_path, e, fallback)
+
+        metrics.incr("cache.sheet.miss")
+        text = body.decode('utf-8-sig')
+        try:
+            os.makedirs(Settings.SHEET_SNAPSHOT_DIR, exist_ok=True)
+            with open(f"{csv_path}.tmp", 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(f"{csv_path}.tmp", csv_path)
+            with open(meta_path, 'w') as f:
+                json.dump({
+                    "url": url,
+                    "etag": headers.get("ETag"),
+                    "last_modified": headers.get("Last-Modified"),
+                    "fetched_at": datetime.now().isoformat(timespec='seconds')
+                }, f, indent=2)
+        except Exception as e:
+            logger.error(f"Failed to save sheet snapshot: {e}")
+        return text
+
+    @staticmethod
+    def _download_failed(csv_path, error, fallback):
+        if not fallback or not os.path.exists(csv_path):
+            logger.error(f"Error downloading Google Sheet: {error}")
+            return None
+        logger.warning(f"Error downloading Google Sheet ({error}); using the last good copy.")
+        metrics.incr("sheets.fallback")
+        with open(csv_path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    @staticmethod
+    def parse_portfolio(text):
+        """
+        CSV text -> portfolio list. Quantity and target cleaning (same rules
+        as parse_quantity/parse_meta) run as pandas string operations over
+        whole columns.
+        """
+        # Imported here so paths that never parse a sheet (e.g. --validate) skip pandas
+        import pandas as pd
+
+        df = pd.read_csv(io.StringIO(text), dtype=object, keep_default_na=False)
+        if not all(col in df.columns for col in REQUIRED_COLUMNS):
+            logger.error(f"Missing columns in Sheet. Expected: {REQUIRED_COLUMNS}")
+            return []
+
+        tickers = df['Ticker'].str.strip().str.upper()
+        categories = df['Categoria'].str.strip().str.upper()
+
+        # Clean Quantity (remove R$, spaces and dots, comma becomes the decimal point)
+        raw_qty = df['Quantidade'].str.replace(r'R\$| |\.', '', regex=True).str.replace(',', '.', regex=False)
+        qty = pd.to_numeric(raw_qty, errors='coerce')
+        invalid = qty.isna() & (raw_qty != '') & (tickers != '')
+        for ticker, value in zip(tickers[invalid], df['Quantidade'][invalid]):
+            logger.warning(f"Invalid quantity for {ticker}: {value}")
+
+        # Clean Meta (Target Allocation)
+        raw_meta = df['Meta'].str.replace(r'%| ', '', regex=True).str.replace(',', '.', regex=False)
+        meta = pd.to_numeric(raw_meta, errors='coerce').fillna(0.0)
+
+        keep = (qty > 0) & (tickers != '')
+        return [
+            {"ticker": ticker, "quantity": quantity, "category": category, "target_pct": target}
+            for ticker, quantity, category, target in zip(
+                tickers[keep].tolist(), qty[keep].tolist(), categories[keep].tolist(), meta[keep].tolist()
+            )
+        ]
+
+    @staticmethod
+    def get_portfolio_from_sheets(url=None):
+        """Reads portfolio data from Google Sheets CSV (defaults to Settings.SHEET_CSV_URL)."""
+        url = url or Settings.SHEET_CSV_URL
         if not url:
             logger.error("SHEET_CSV_URL not found in settings.")
             return []
             
         try:
             logger.info("Baixando carteira do Google Sheets...")
-            df = pd.read_csv(url)
-            
-            # Expected columns: Ticker, Quantidade, Categoria, Meta
-            required_cols = ['Ticker', 'Quantidade', 'Categoria', 'Meta']
-            if not all(col in df.columns for col in required_cols):
-                logger.error(f"Missing columns in Sheet. Expected: {required_cols}")
+            text = SheetsManager.download_csv(url)
+            if text is None:
                 return []
-                
-            portfolio = []
-            for _, row in df.iterrows():
-                ticker = str(row['Ticker']).strip().upper()
-                
-                # Clean Quantity (remove R$, dots, replace comma with dot)
-                qty_str = str(row['Quantidade'])
-                qty_str = qty_str.replace('R$', '').replace(' ', '').replace('.', '').replace(',', '.')
-                try:
-                    qty = float(qty_str)
-                except ValueError:
-                    logger.warning(f"Invalid quantity for {ticker}: {row['Quantidade']}")
-                    qty = 0.0
-
-                # Clean Meta (Target Allocation)
-                meta_str = str(row['Meta'])
-                meta_str = meta_str.replace('%', '').replace(' ', '').replace(',', '.')
-                try:
-                    meta = float(meta_str)
-                except ValueError:
-                    meta = 0.0
-                    
-                category = str(row['Categoria']).strip().upper()
-                
-                if qty > 0:
-                    portfolio.append({
-                        "ticker": ticker,
-                        "quantity": qty,
-                        "category": category,
-                        "target_pct": meta
-                    })
-            
+
+            portfolio = SheetsManager.parse_portfolio(text)
             logger.info(f"Carteira carregada com sucesso: {len(portfolio)} ativos.")
             return portfolio
             
         except Exception as e:
             logger.error(f"Error reading Google Sheet: {e}")
             return []
+
+    @staticmethod
+    def validate_sheet(url=None, timeout=30):
+        """
+        Downloads and checks the sheet with the csv module only (no pandas).
+        Returns (positions, problems): the number of rows that would be
+        loaded and a list of human-readable problems (empty when valid).
+        """
+        url = url or Settings.SHEET_CSV_URL
+        if not url:
+            return 0, ["SHEET_CSV_URL not found in settings."]
+
+        # No snapshot fallback here: validation is about the live sheet
+        text = SheetsManager.download_csv(url, timeout=timeout, fallback=False)
+        if text is None:
+            return 0, ["Could not download the sheet (see the log for the error)."]
+
+        reader = csv.DictReader(io.StringIO(text))
+        missing = [col for col in REQUIRED_COLUMNS if col not in (reader.fieldnames or [])]
+        if missing:
+            return 0, [f"Missing columns in Sheet: {missing}. Expected: {REQUIRED_COLUMNS}"]
+
+        problems = []
+        seen = set()
+        positions = 0
+        for line, row in enumerate(reader, start=2):
+            ticker = str(row['Ticker'] or '').strip().upper()
+            if not ticker:
+                continue
+            try:
+                qty = SheetsManager.parse_quantity(row['Quantidade'])
+            except ValueError:
+                problems.append(f"Line {line}: invalid quantity for {ticker}: {row['Quantidade']!r}")
+                continue
+
+            category = str(row['Categoria'] or '').strip().upper()
+            if category not in Settings.CATEGORY_MAP:
+                problems.append(f"Line {line}: unknown category {category!r} for {ticker}")
+            if ticker in seen:
+                problems.append(f"Line {line}: duplicated ticker {ticker}")
+            seen.add(ticker)
+            positions += qty > 0
+
+        if not positions:
+            problems.append("The sheet has no position with quantity > 0.")
+        return positions, problems
@@ -0,0 +1,188 @@
+import time
+import logging
+import numpy as np
+import pandas as pd
+import schedule
+from config.settings import Settings
+from src.data_collector import DataCollector
+from src.indicators import IndicatorsProvider
+from src.portfolio import PortfolioManager
+from src.sheets_manager import SheetsManager
+from src.metrics import metrics
+from src.outbound import outbound
+
+logger = logging.getLogger(__name__)
+
+class PortfolioWatcher:
+    """
+    Long-running mode: loads the sheet, the one-year price panel,
+    fundamentals and indicators once and keeps them in memory.
+
+    Every WATCH_REFRESH_MINUTES only the latest quotes are downloaded; they
+    are merged into the warm panel and only the positions whose price
+    changed (plus every USD position when BRL=X moved) are revalued.
+    At WATCH_REPORT_TIME the sheet, indicators and fundamentals are
+    refreshed (through their caches) and `report` is called with the warm
+    data, like send_portfolio_report in main.py.
+    """
+
+    def __init__(self, report, sheet_url=None):
+        self.report_fn = report
+        self.sheet_url = sheet_url
+        self.scheduler = schedule.Scheduler()
+        self.portfolio_data = None
+        self.market_data = None
+        self.indicators = None
+        self.collector = None
+        self.total_value = 0.0
+        self.reported_value = 0.0
+
+    def warm_up(self, portfolio_data=None):
+        """Full load: sheet, market data (prices, panel, fundamentals) and indicators."""
+        with metrics.span("watch.warm_up"):
+            self.portfolio_data = portfolio_data or SheetsManager.get_portfolio_from_sheets(self.sheet_url)
+            if not self.portfolio_data:
+                raise RuntimeError("Failed to load portfolio data.")
+            self.collector = DataCollector(self.portfolio_data)
+            self.market_data = self.collector.get_market_data()
+            self.indicators = IndicatorsProvider().get()
+            self._index_positions()
+        self.reported_value = self.total_value
+        logger.info(f"Watch: {len(self.portfolio_data)} positions warm, total R$ {self.total_value:,.2f}.")
+
+    def _index_positions(self):
+        """Values every position once and keeps the arrays the incremental revaluation works on."""
+        manager = PortfolioManager(self.portfolio_data, self.market_data, self.indicators)
+        df, self.total_value = manager.value_positions()
+        self.tickers = df['ticker'].to_numpy() if not df.empty else np.array([], dtype=object)
+        self.qty = df['qty'].to_numpy(dtype=float) if not df.empty else np.zeros(0)
+        self.values = df['value_brl'].to_numpy(dtype=float, copy=True) if not df.empty else np.zeros(0)
+        self.is_rf = (df['category'] == "RENDA_FIXA").to_numpy() if not df.empty else np.zeros(0, dtype=bool)
+        self.is_usd = PortfolioManager.usd_mask(self.tickers, df['category']) if not df.empty else np.zeros(0, dtype=bool)
+
+    def _usd_rate(self):
+        rate = self.market_data.get('BRL=X', {}).get('price', 0)
+        return rate if rate > 0 else PortfolioManager.USD_FALLBACK_RATE
+
+    def refresh_quotes(self):
+        """
+        Downloads the last few days of closes for every quoted ticker, merges
+        them into the warm panel and revalues the positions whose price
+        changed. Returns the tickers that changed.
+        """
+        started = time.perf_counter()
+        quoted = self.collector.quoted_tickers()
+        if not quoted:
+            return []
+        # The risk benchmark is only in the panel, not in market_data
+        history = self.market_data.history
+        if history is not None and Settings.RISK_BENCHMARK in history.columns and Settings.RISK_BENCHMARK not in quoted:
+            quoted.append(Settings.RISK_BENCHMARK)
+
+        fresh = self.collector.refresh_prices(quoted, period="5d")
+        fetched = time.perf_counter()
+        if fresh.empty:
+            logger.warning("Watch: no quotes received, keeping the previous valuation.")
+            return []
+
+        panel = self._merge_panel(history, fresh) if history is not None else fresh
+        # Keep the one-year window the report and the risk metrics expect
+        panel = panel[panel.index >= panel.index[-1] - np.timedelta64(366, 'D')]
+        self.market_data.history = panel
+
+        summary = DataCollector.summarize_prices(panel[list(fresh.columns)])
+        changed = []
+        for ticker, price, change_1d, change_12m in zip(
+            summary.index, summary['price'], summary['change_1d'], summary['change_12m']
+        ):
+            entry = self.market_data.get(ticker)
+            if entry is not None and price > 0 and price != entry.get('price'):
+                entry.update(price=float(price), change_1d=float(change_1d), change_12m=float(change_12m))
+                changed.append(ticker)
+
+        revalued = self._revalue(changed)
+        elapsed = (time.perf_counter() - fetched) * 1000
+        metrics.incr("watch.quotes_changed", len(changed))
+        variation = (self.total_value / self.reported_value - 1) * 100 if self.reported_value else 0.0
+        logger.info(f"Watch: R$ {self.total_value:,.2f} ({variation:+.2f}% since last report) | "
+                    f"{len(changed)} quotes changed, {revalued} positions revalued in {elapsed:.1f} ms "
+                    f"(download {(fetched - started) * 1000:.0f} ms).")
+        return changed
+
+    @staticmethod
+    def _merge_panel(history, fresh):
+        """`history` updated with the non-NaN closes of `fresh` (as combine_first, in one array pass)."""
+        index = history.index.union(fresh.index)
+        columns = list(history.columns) + [c for c in fresh.columns if c not in history.columns]
+        old = history.reindex(index=index, columns=columns).to_numpy(dtype=float)
+        new = fresh.reindex(index=index, columns=columns).to_numpy(dtype=float)
+        return pd.DataFrame(np.where(np.isnan(new), old, new), index=index, columns=columns)
+
+    def _revalue(self, changed):
+        """Recomputes value_brl only for the rows affected by `changed`; returns how many."""
+        rows = np.isin(self.tickers, changed) & ~self.is_rf
+        if 'BRL=X' in changed:
+            rows |= self.is_usd
+        if not rows.any():
+            return 0
+
+        prices = np.array([self.market_data[t]['price'] for t in self.tickers[rows]], dtype=float)
+        fx = np.where(self.is_usd[rows], self._usd_rate(), 1.0)
+        updated = np.nan_to_num(prices * self.qty[rows] * fx)
+        self.total_value += float(updated.sum() - self.values[rows].sum())
+        self.values[rows] = updated
+        return int(rows.sum())
+
+    def report(self):
+        """Refreshes the slow-changing inputs, then sends the full report from the warm state."""
+        metrics.reset()
+        try:
+            portfolio_data = SheetsManager.get_portfolio_from_sheets(self.sheet_url)
+            if portfolio_data and portfolio_data != self.portfolio_data:
+                if {i['ticker'] for i in portfolio_data} != {i['ticker'] for i in self.portfolio_data}:
+                    logger.info("Watch: sheet tickers changed, reloading market data.")
+                    self.warm_up(portfolio_data)
+                else:
+                    logger.info("Watch: sheet quantities changed.")
+                    self.portfolio_data = portfolio_data
+                    self.collector.portfolio_data = portfolio_data
+            self.refresh_quotes()
+
+            # Indicators are memoized per process; fundamentals only hit Yahoo when their TTL expired
+            IndicatorsProvider.reset()
+            self.indicators = IndicatorsProvider().get()
+            # Tickers whose fetch failed with nothing cached are left out and keep their warm values
+            for ticker, fundamentals in self.collector.fetch_fundamentals(self.collector.quoted_tickers()).items():
+                self.market_data[ticker].update(fundamentals)
+            self._index_positions()
+
+            from src.news_collector import NewsCollector
+            self.report_fn(self.portfolio_data, self.market_data, self.indicators, NewsCollector().get_top_news())
+            self.reported_value = self.total_value
+        finally:
+            outbound.log_summary()
+            metrics.write()
+
+    def refresh_cycle(self):
+        """Scheduled quote refresh; its metrics are dropped afterwards so the daemon's spans stay bounded."""
+        try:
+            self.refresh_quotes()
+        finally:
+            metrics.reset()
+
+    def _safe(self, fn):
+        # A failed refresh or report must not stop the daemon
+        try:
+            fn()
+        except Exception as e:
+            logger.error(f"Watch: {fn.__name__} failed: {e}", exc_info=True)
+
+    def run(self):
+        self.warm_up()
+        self.scheduler.every(Settings.WATCH_REFRESH_MINUTES).minutes.do(self._safe, self.refresh_cycle)
+        self.scheduler.every().day.at(Settings.WATCH_REPORT_TIME).do(self._safe, self.report)
+        logger.info(f"Watch: quotes every {Settings.WATCH_REFRESH_MINUTES} min, report daily at {Settings.WATCH_REPORT_TIME}.")
+        while True:
+            self.scheduler.run_pending()
+            idle = self.scheduler.idle_seconds
+            time.sleep(min(max(idle, 1), 60) if idle is not None else 60)